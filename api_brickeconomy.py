@@ -9,31 +9,37 @@ import datetime
 BRICKECONOMY_API_KEY = os.environ["BRICKECONOMY_API_KEY"]
 BRICKECONOMY_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36"
 
-def get_pricing_info(set_num: str) -> str:
+def fetch_pricing_data(set_num: str):
 	"""
-	Получает информацию о ценах из BrickEconomy API по номеру набора.
-	Возвращает отформатированный HTML-текст для Telegram.
+	Запрашивает данные о ценах набора из BrickEconomy.
+	Возвращает кортеж (data, error): data — словарь из поля "data" ответа,
+	error — готовый HTML-текст ошибки для Telegram (data при этом None).
 	"""
-	try:
-		url = f"https://www.brickeconomy.com/api/v1/set/{set_num}"
-		headers = {
-			"x-apikey": BRICKECONOMY_API_KEY,
-			"User-Agent": BRICKECONOMY_USER_AGENT,
-			"Accept": "application/json"
-		}
-		response = requests.get(url, headers=headers, timeout=10)
+	url = f"https://www.brickeconomy.com/api/v1/set/{set_num}"
+	headers = {
+		"x-apikey": BRICKECONOMY_API_KEY,
+		"User-Agent": BRICKECONOMY_USER_AGENT,
+		"Accept": "application/json"
+	}
+	response = requests.get(url, headers=headers, timeout=10)
+
+	if response.status_code != 200:
+		escaped_body = html.escape(response.text[:1000])
+		return None, f"⚠️ BrickEconomy error: {response.status_code}\n<pre>{escaped_body}</pre>"
 
-		if response.status_code != 200:
-			escaped_body = html.escape(response.text[:1000])
-			return f"⚠️ BrickEconomy error: {response.status_code}\n<pre>{escaped_body}</pre>"
+	try:
+		json_data = response.json()
+	except Exception:
+		escaped_body = html.escape(response.text[:1000])
+		return None, f"⚠️ Failed to parse JSON from BrickEconomy:\n<pre>{escaped_body}</pre>"
 
-		try:
-			json_data = response.json()
-		except Exception:
-			escaped_body = html.escape(response.text[:1000])
-			return f"⚠️ Failed to parse JSON from BrickEconomy:\n<pre>{escaped_body}</pre>"
+	return json_data.get("data", {}), None
 
-		data = json_data.get("data", {})
+def format_pricing_info(data: dict) -> str:
+	"""
+	Форматирует данные BrickEconomy (поле "data" ответа) в HTML-текст для Telegram.
+	"""
+	try:
 		lines = ["\n<b>📊 BrickEconomy Set Info:</b>"]
 
 		# Сроки продаж
@@ -109,4 +115,4 @@ def get_pricing_info(set_num: str) -> str:
 		return "\n".join(lines)
 
 	except Exception as e:
-		return f"⚠️ Request to BrickEconomy failed:\n{str(e)}"
+		return f"⚠️ Failed to format BrickEconomy data:\n{str(e)}"
@@ -5,17 +5,72 @@
 - Получение информации о LEGO-наборе
 - Загрузка всех деталей набора
 - Получение категорий деталей
+
+В режиме REBRICKABLE_LOOKUP_MODE=mirror данные сначала читаются из локального
+зеркала каталога (catalog_mirror.py), а API вызывается только для отсутствующих наборов.
 """
 
 import os
+import time
 import requests
+from cache import TTLCache
+from catalog_mirror import mirror_get_set_details, mirror_get_all_parts, mirror_get_categories
 
 # Получаем API-ключ Rebrickable из переменной окружения
 REBRICKABLE_API_KEY = os.environ["REBRICKABLE_API_KEY"]
 
+# Режим поиска: "api" — только Rebrickable API, "mirror" — сначала локальное зеркало
+REBRICKABLE_LOOKUP_MODE = os.getenv("REBRICKABLE_LOOKUP_MODE", "api")
+
+# Время жизни кеша ответов API (в часах) — должно перекрывать интервал прогрева кеша
+REBRICKABLE_CACHE_TTL_HOURS = float(os.getenv("REBRICKABLE_CACHE_TTL_HOURS", "12"))
+
+# Кеши ответов: данные наборов, инвентари, категории деталей
+set_data_cache = TTLCache(max_items=2048, ttl_seconds=REBRICKABLE_CACHE_TTL_HOURS * 3600)
+parts_cache = TTLCache(max_items=256, ttl_seconds=REBRICKABLE_CACHE_TTL_HOURS * 3600)
+categories_cache = TTLCache(max_items=1, ttl_seconds=REBRICKABLE_CACHE_TTL_HOURS * 3600)
+
+# Таймаут HTTP-запросов к Rebrickable (в секундах). asyncio.wait_for не прерывает поток,
+# поэтому без таймаута зависший запрос навсегда занимает поток общего пула to_thread.
+REBRICKABLE_TIMEOUT_SECONDS = 10
+
+def use_mirror() -> bool:
+	"""
+	Включено ли чтение из локального зеркала каталога.
+	"""
+	return REBRICKABLE_LOOKUP_MODE == "mirror"
+
+def try_mirror(lookup, *args):
+	"""
+	Выполняет запрос к зеркалу; при ошибке базы возвращает None, чтобы сработал fallback на API.
+	"""
+	try:
+		return lookup(*args)
+	except Exception as e:
+		print(f"⚠️ Catalog mirror lookup failed: {e}")
+		return None
+
 # ============================
 # 🧱 Получение информации о наборе
 # ============================
+def get_set_data(set_id, timeout: float = REBRICKABLE_TIMEOUT_SECONDS):
+	"""
+	Получает полный JSON набора из Rebrickable (с set_img_url и set_url).
+	Возвращает кортеж (status_code, data); успешные ответы кешируются.
+	timeout — таймаут HTTP-запроса в секундах.
+	"""
+	data = set_data_cache.get(set_id)
+	if data is not None:
+		return 200, data
+	url = f"https://rebrickable.com/api/v3/lego/sets/{set_id}/"
+	headers = {"Authorization": f"key {REBRICKABLE_API_KEY}"}
+	response = requests.get(url, headers=headers, timeout=timeout)
+	if response.status_code != 200:
+		return response.status_code, None
+	data = response.json()
+	set_data_cache.set(set_id, data)
+	return 200, data
+
 def get_set_details(set_id):
 	"""
 	Получает базовую информацию о наборе (номер, имя, год и количество деталей)
@@ -23,11 +78,12 @@ def get_set_details(set_id):
 		(set_num, name, year, num_parts)
 	или ("n/a", ...) если не удалось получить данные.
 	"""
-	url = f"https://rebrickable.com/api/v3/lego/sets/{set_id}/"
-	headers = {"Authorization": f"key {REBRICKABLE_API_KEY}"}
-	response = requests.get(url, headers=headers)
-	if response.status_code == 200:
-		data = response.json()
+	if use_mirror():
+		details = try_mirror(mirror_get_set_details, set_id)
+		if details:
+			return details
+	status_code, data = get_set_data(set_id)
+	if status_code == 200:
 		set_num = data.get("set_num", "n/a")
 		name = data.get("name", "n/a")
 		year = data.get("year", "n/a")
@@ -40,19 +96,32 @@ def get_set_details(set_id):
 # ============================
 def get_all_parts(set_id):
 	"""
-	Получает все детали набора, обходя все страницы (pagination)
+	Получает все детали набора, обходя все страницы (pagination, по 1000 на страницу)
 	Возвращает список словарей, каждый словарь описывает одну деталь.
+	Полностью загруженные инвентари кешируются.
 	"""
+	parts = parts_cache.get(set_id)
+	if parts is not None:
+		return parts
+	if use_mirror():
+		parts = try_mirror(mirror_get_all_parts, set_id)
+		if parts:
+			parts_cache.set(set_id, parts)
+			return parts
 	parts = []
-	url = f"https://rebrickable.com/api/v3/lego/sets/{set_id}/parts/"
+	complete = True
+	url = f"https://rebrickable.com/api/v3/lego/sets/{set_id}/parts/?page_size=1000"
 	headers = {"Authorization": f"key {REBRICKABLE_API_KEY}"}
 	while url:
-		response = requests.get(url, headers=headers)
+		response = requests.get(url, headers=headers, timeout=REBRICKABLE_TIMEOUT_SECONDS)
 		if response.status_code != 200:
+			complete = False
 			break
 		data = response.json()
 		parts.extend(data.get("results", []))
 		url = data.get("next")
+	if complete and parts:
+		parts_cache.set(set_id, parts)
 	return parts
 
 # ============================
@@ -62,13 +131,21 @@ def get_categories():
 	"""
 	Получает все категории деталей из Rebrickable и возвращает словарь:
 		{ category_id: category_name }
-	Обходит все страницы результата.
+	Обходит все страницы результата. Результат кешируется.
 	"""
+	categories = categories_cache.get("all")
+	if categories is not None:
+		return categories
+	if use_mirror():
+		categories = try_mirror(mirror_get_categories)
+		if categories:
+			categories_cache.set("all", categories)
+			return categories
 	categories = {}
 	url = "https://rebrickable.com/api/v3/lego/part_categories/"
 	headers = {"Authorization": f"key {REBRICKABLE_API_KEY}"}
 	while url:
-		response = requests.get(url, headers=headers)
+		response = requests.get(url, headers=headers, timeout=REBRICKABLE_TIMEOUT_SECONDS)
 		if response.status_code != 200:
 			break
 		data = response.json()
@@ -78,4 +155,46 @@ def get_categories():
 			if cat_id is not None and cat_name is not None:
 				categories[cat_id] = cat_name
 		url = data.get("next")
+	if categories:
+		categories_cache.set("all", categories)
 	return categories
+
+# ============================
+# 📚 Постраничная выгрузка всех наборов и тем
+# ============================
+# Пауза между страницами полной выгрузки — Rebrickable ограничивает API ~1 запросом в секунду
+REBRICKABLE_PAGE_DELAY_SECONDS = 1
+
+def get_all_pages(url):
+	"""
+	Обходит все страницы списка Rebrickable API и возвращает объединённый список results.
+	Частичный результат не возвращается: если любая страница ответила не 200 (например, 429),
+	выбрасывается RuntimeError, чтобы вызывающий код не принял обрезанный список за полный.
+	"""
+	results = []
+	headers = {"Authorization": f"key {REBRICKABLE_API_KEY}"}
+	while url:
+		response = requests.get(url, headers=headers, timeout=30)
+		if response.status_code != 200:
+			raise RuntimeError(f"{url}: HTTP {response.status_code}")
+		data = response.json()
+		results.extend(data.get("results", []))
+		url = data.get("next")
+		if url:
+			time.sleep(REBRICKABLE_PAGE_DELAY_SECONDS)
+	return results
+
+def get_all_sets():
+	"""
+	Получает полный список наборов (страницами по 1000) — используется для поискового индекса.
+	При ошибке любой страницы выбрасывает RuntimeError.
+	"""
+	return get_all_pages("https://rebrickable.com/api/v3/lego/sets/?page_size=1000")
+
+def get_themes():
+	"""
+	Получает все темы и возвращает словарь: { theme_id: theme_name }
+	При ошибке любой страницы выбрасывает RuntimeError.
+	"""
+	themes = get_all_pages("https://rebrickable.com/api/v3/lego/themes/?page_size=1000")
+	return {theme["id"]: theme["name"] for theme in themes if theme.get("id") is not None}
@@ -0,0 +1,189 @@
+# batch_lookup.py
+
+"""
+Пакетный поиск наборов:
+- Извлечение списка кодов из сообщения или загруженного TXT/CSV-файла
+- Параллельные запросы к Rebrickable (цены — из истории снимков) с ограничением числа одновременных запросов
+  и частоты обращений к API
+- Итог в виде компактной таблицы или CSV-документа с суммами по деталям и стоимости
+"""
+
+import re
+import io
+import csv
+import html
+import asyncio
+from api_rebrickable import get_set_data, set_data_cache, use_mirror, try_mirror
+from catalog_mirror import mirror_get_set_details
+from price_history import get_current_value
+
+# Максимум кодов в одном запросе
+BATCH_MAX_CODES = 100
+
+# Сколько наборов запрашиваем одновременно
+BATCH_CONCURRENCY = 2
+
+# Минимальный интервал между запросами к Rebrickable (в секундах) — API ограничен ~1 запросом в секунду.
+# Наборы из кеша и зеркала идут без паузы.
+BATCH_REQUEST_INTERVAL_SECONDS = 1
+
+# Больше строк — отправляем CSV-документ вместо таблицы в сообщении
+BATCH_TABLE_MAX_ROWS = 25
+
+# Код набора внутри произвольного текста: 4–5 цифр и необязательный суффикс версии
+CODE_PATTERN = re.compile(r"(?<![\d-])(\d{4,5})(-\d+)?(?![\d-])")
+
+def extract_set_codes(text: str):
+	"""
+	Находит в тексте все коды наборов, дополняет суффиксом -1 и убирает повторы (с сохранением порядка).
+	"""
+	codes = []
+	for match in CODE_PATTERN.finditer(text or ""):
+		codes.append(f"{match.group(1)}{match.group(2) or '-1'}")
+	return list(dict.fromkeys(codes))
+
+# Названия колонки с номером набора в CSV-выгрузках (Rebrickable, BrickLink, самодельные вишлисты)
+CSV_CODE_COLUMNS = ("set_num", "set_number", "set", "set_id", "number", "code")
+
+def extract_set_codes_from_csv(text: str):
+	"""
+	Извлекает коды наборов из CSV: только из колонки с номером набора
+	(по заголовку из CSV_CODE_COLUMNS), а если такой нет — из первой колонки.
+	Годы, количество деталей и цены из остальных колонок не считаются кодами.
+	"""
+	rows = list(csv.reader(io.StringIO(text or "")))
+	if not rows:
+		return []
+	header = [cell.strip().lower().replace(" ", "_") for cell in rows[0]]
+	column = next((header.index(name) for name in CSV_CODE_COLUMNS if name in header), None)
+	if column is None:
+		column = 0
+	else:
+		rows = rows[1:]
+
+	codes = []
+	for row in rows:
+		if len(row) > column:
+			match = CODE_PATTERN.fullmatch(row[column].strip())
+			if match:
+				codes.append(f"{match.group(1)}{match.group(2) or '-1'}")
+	return list(dict.fromkeys(codes))
+
+def error_row(set_id: str):
+	"""
+	Строка результата для набора, который не удалось получить (429, 5xx, сетевая ошибка).
+	"""
+	return {"set_num": set_id, "name": "error", "year": "", "num_parts": None, "value": None, "error": True}
+
+def lookup_one(set_id: str):
+	"""
+	Синхронно получает данные одного набора и его текущую стоимость.
+	Возвращает словарь: set_num, name, year, num_parts, value (None, если цены нет), error.
+	Только 404 означает "not found"; любой другой ответ или исключение — строка с name = "error",
+	чтобы набор не выпадал из итогов молча и не прерывал весь пакет.
+	"""
+	try:
+		details = try_mirror(mirror_get_set_details, set_id) if use_mirror() else None
+		if details is None:
+			status_code, data = get_set_data(set_id)
+			if status_code == 404:
+				return {"set_num": set_id, "name": "not found", "year": "", "num_parts": None, "value": None, "error": False}
+			if status_code != 200:
+				print(f"⚠️ Batch lookup failed for {set_id}: HTTP {status_code}")
+				return error_row(set_id)
+			details = (data.get("set_num", set_id), data.get("name", "n/a"), data.get("year", ""), data.get("num_parts"))
+		set_num, name, year, num_parts = details
+		return {
+			"set_num": set_num,
+			"name": name,
+			"year": year,
+			"num_parts": num_parts if isinstance(num_parts, int) else None,
+			"value": get_current_value(set_id),
+			"error": False,
+		}
+	except Exception as e:
+		print(f"⚠️ Batch lookup failed for {set_id}: {e}")
+		return error_row(set_id)
+
+def needs_request(set_id: str) -> bool:
+	"""
+	Пойдёт ли поиск набора в Rebrickable API (набора нет в кеше и зеркало не используется).
+	"""
+	return not use_mirror() and set_id not in set_data_cache
+
+async def lookup_sets(codes):
+	"""
+	Запрашивает наборы параллельно, не более BATCH_CONCURRENCY одновременно,
+	а запросы к API разносит не чаще чем раз в BATCH_REQUEST_INTERVAL_SECONDS.
+	Блокирующие HTTP-запросы выполняются в пуле потоков. Порядок результатов совпадает с порядком кодов.
+	"""
+	loop = asyncio.get_running_loop()
+	semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+	next_request_at = loop.time()
+
+	async def bounded(set_id):
+		nonlocal next_request_at
+		async with semaphore:
+			if needs_request(set_id):
+				delay = next_request_at - loop.time()
+				next_request_at = max(next_request_at, loop.time()) + BATCH_REQUEST_INTERVAL_SECONDS
+				if delay > 0:
+					await asyncio.sleep(delay)
+			return await asyncio.to_thread(lookup_one, set_id)
+
+	return await asyncio.gather(*(bounded(code) for code in codes))
+
+def summarize_totals(rows):
+	"""
+	Возвращает (найдено наборов, всего деталей, суммарная стоимость, наборов с ценой, наборов с ошибкой).
+	"""
+	found = [row for row in rows if row["num_parts"] is not None]
+	priced = [row for row in rows if row["value"]]
+	total_parts = sum(row["num_parts"] for row in found)
+	total_value = sum(row["value"] for row in priced)
+	failed = sum(1 for row in rows if row["error"])
+	return len(found), total_parts, total_value, len(priced), failed
+
+def format_totals(rows) -> str:
+	"""
+	Формирует HTML-строку с итогами по списку наборов.
+	"""
+	found, total_parts, total_value, priced, failed = summarize_totals(rows)
+	text = f"<b>Total:</b> {found}/{len(rows)} sets · {total_parts} pieces"
+	if priced:
+		text += f" · ${total_value:.2f} <i>(value of {priced} sets)</i>"
+	if failed:
+		text += f"\n⚠️ {failed} sets could not be loaded (API error) and are not counted — please try again later."
+	return text
+
+def format_batch_table(rows) -> str:
+	"""
+	Формирует компактную моноширинную таблицу для Telegram (HTML) с итогами.
+	"""
+	lines = [f"{'Set':<9} {'Pcs':>5} {'Value':>8}  Name"]
+	for row in rows:
+		pieces = str(row["num_parts"]) if row["num_parts"] is not None else "–"
+		value = f"${row['value']:.0f}" if row["value"] else "–"
+		name = row["name"] if len(row["name"]) <= 28 else row["name"][:27] + "…"
+		lines.append(f"{row['set_num']:<9} {pieces:>5} {value:>8}  {name}")
+	table = html.escape("\n".join(lines))
+	return f"<pre>{table}</pre>\n{format_totals(rows)}"
+
+def build_batch_csv(rows) -> bytes:
+	"""
+	Формирует CSV-файл с результатами (UTF-8 с BOM, чтобы корректно открывался в Excel).
+	"""
+	buffer = io.StringIO()
+	writer = csv.writer(buffer)
+	writer.writerow(["set_num", "name", "year", "num_parts", "current_value_new_usd"])
+	for row in rows:
+		writer.writerow([
+			row["set_num"],
+			row["name"],
+			row["year"],
+			row["num_parts"] if row["num_parts"] is not None else "",
+			f"{row['value']:.2f}" if row["value"] else "",
+		])
+	found, total_parts, total_value, priced, failed = summarize_totals(rows)
+	writer.writerow(["TOTAL", f"{found}/{len(rows)} sets", "", total_parts, f"{total_value:.2f}" if priced else ""])
+	return buffer.getvalue().encode("utf-8-sig")
@@ -0,0 +1,72 @@
+# cache.py
+
+"""
+Простой in-process кеш для ответов внешних API:
+- Ограничение по количеству записей (вытесняются самые давно использованные, LRU)
+- Время жизни записи (TTL)
+- Потокобезопасен: кеш читается и из event loop, и из asyncio.to_thread
+"""
+
+import time
+import threading
+from collections import OrderedDict
+
+class TTLCache:
+	"""
+	LRU-кеш с временем жизни записей.
+	None не кешируется — get() возвращает None при отсутствии или устаревании записи.
+	"""
+
+	def __init__(self, max_items: int, ttl_seconds: float):
+		self.max_items = max_items
+		self.ttl_seconds = ttl_seconds
+		self._items = OrderedDict()
+		self._lock = threading.Lock()
+
+	def get(self, key):
+		"""
+		Возвращает значение по ключу или None, если записи нет или она устарела.
+		"""
+		with self._lock:
+			item = self._items.get(key)
+			if item is None:
+				return None
+			expires_at, value = item
+			if expires_at < time.monotonic():
+				del self._items[key]
+				return None
+			self._items.move_to_end(key)
+			return value
+
+	def set(self, key, value):
+		"""
+		Сохраняет значение, вытесняя самую старую запись при переполнении.
+		"""
+		if value is None:
+			return
+		with self._lock:
+			self._items[key] = (time.monotonic() + self.ttl_seconds, value)
+			self._items.move_to_end(key)
+			while len(self._items) > self.max_items:
+				self._items.popitem(last=False)
+
+	def expires_in(self, key) -> float:
+		"""
+		Сколько секунд осталось жить записи (0, если записи нет).
+		"""
+		with self._lock:
+			item = self._items.get(key)
+			return max(0.0, item[0] - time.monotonic()) if item else 0.0
+
+	def discard(self, key):
+		"""
+		Удаляет запись, если она есть.
+		"""
+		with self._lock:
+			self._items.pop(key, None)
+
+	def __contains__(self, key):
+		return self.get(key) is not None
+
+	def __len__(self):
+		return len(self._items)
@@ -0,0 +1,128 @@
+# cache_warmer.py
+
+"""
+Прогрев кешей для популярных наборов:
+- При старте и затем по расписанию берёт top-N наборов из set_popularity
+- Загружает в кеши данные набора, инвентарь, категории и сводки по цветам/типам
+  (цены хранятся в истории и обновляются ночным заданием price_history.py)
+- Не тратит больше CACHE_WARM_CALL_BUDGET запросов к внешним API за один прогон
+- Заодно периодически сохраняет накопленную популярность в Postgres
+"""
+
+import os
+import math
+import asyncio
+import time
+from db import get_popular_sets
+from popularity import flush_popularity
+from api_rebrickable import (
+	get_set_data, get_all_parts, get_categories,
+	set_data_cache, parts_cache, categories_cache
+)
+from handlers import get_sorted_summary, summary_cache
+from inventory_index import get_set_inventory, inventory_cache
+
+# Сколько самых популярных наборов прогревать
+CACHE_WARM_TOP_N = int(os.getenv("CACHE_WARM_TOP_N", "50"))
+
+# Интервал прогрева (в часах) — должен быть меньше TTL кешей API
+CACHE_WARM_INTERVAL_HOURS = float(os.getenv("CACHE_WARM_INTERVAL_HOURS", "6"))
+
+# Максимум запросов к Rebrickable за один прогон
+CACHE_WARM_CALL_BUDGET = int(os.getenv("CACHE_WARM_CALL_BUDGET", "300"))
+
+# Интервал сохранения счётчиков популярности (в секундах)
+POPULARITY_FLUSH_SECONDS = 60
+
+def needs_refresh(cache, key) -> bool:
+	"""
+	Нужно ли обновить запись: её нет или она истечёт до следующего прогрева.
+	Такая запись удаляется из кеша, чтобы следующий вызов API загрузил свежие данные.
+	"""
+	if cache.expires_in(key) > CACHE_WARM_INTERVAL_HOURS * 3600:
+		return False
+	cache.discard(key)
+	return True
+
+def warm_set(set_id: str, budget: int) -> int:
+	"""
+	Прогревает кеши одного набора, не превышая budget запросов.
+	Запросы считаются только для отсутствующих или скоро истекающих записей;
+	инвентарь оценивается в ceil(num_parts / 1000) страниц.
+	Возвращает число потраченных запросов.
+	"""
+	spent = 0
+
+	if needs_refresh(set_data_cache, set_id):
+		if budget - spent < 1:
+			return spent
+		status_code, data = get_set_data(set_id)
+		spent += 1
+		if status_code != 200:
+			return spent
+	data = set_data_cache.get(set_id)
+
+	pages = max(1, math.ceil((data.get("num_parts") or 0) / 1000))
+	if parts_cache.expires_in(set_id) <= CACHE_WARM_INTERVAL_HOURS * 3600 and budget - spent >= pages:
+		parts_cache.discard(set_id)
+		# Производные кеши пересчитываются из свежего инвентаря
+		summary_cache.discard(("parts_by_color", set_id))
+		summary_cache.discard(("parts_by_type", set_id))
+		inventory_cache.discard(set_id)
+		get_all_parts(set_id)
+		spent += pages
+
+	# Сводки и индекс инвентаря строятся из закешированных деталей без запросов к API.
+	# Если инвентарь не в кеше (не хватило бюджета), они бы скачали его мимо бюджета.
+	if set_id not in parts_cache:
+		return spent
+	get_sorted_summary("parts_by_color", set_id)
+	get_sorted_summary("parts_by_type", set_id)
+	get_set_inventory(set_id)
+
+	return spent
+
+def warm_caches(limit: int = CACHE_WARM_TOP_N, budget: int = CACHE_WARM_CALL_BUDGET):
+	"""
+	Прогревает кеши для limit самых популярных наборов в пределах budget запросов.
+	Возвращает кортеж (сколько наборов обработано, сколько запросов потрачено).
+	"""
+	spent = 0
+	if budget >= 1 and needs_refresh(categories_cache, "all"):
+		get_categories()
+		spent += 1
+
+	warmed = 0
+	for set_id in get_popular_sets(limit):
+		if spent >= budget:
+			break
+		try:
+			spent += warm_set(set_id, budget - spent)
+			warmed += 1
+		except Exception as e:
+			print(f"⚠️ Cache warm-up failed for {set_id}: {e}")
+	return warmed, spent
+
+async def cache_warm_loop():
+	"""
+	Фоновая задача: раз в POPULARITY_FLUSH_SECONDS сохраняет счётчики популярности,
+	раз в CACHE_WARM_INTERVAL_HOURS (и сразу при старте) прогревает кеши.
+	Блокирующая работа выполняется в отдельном потоке.
+	"""
+	print(f"🔥 Cache warm-up job started: top {CACHE_WARM_TOP_N} sets every {CACHE_WARM_INTERVAL_HOURS} hours...")
+	next_warm_at = 0
+	while True:
+		try:
+			await asyncio.to_thread(flush_popularity)
+		except Exception as e:
+			print(f"⚠️ Failed to save set popularity: {e}")
+
+		if time.monotonic() >= next_warm_at:
+			next_warm_at = time.monotonic() + CACHE_WARM_INTERVAL_HOURS * 3600
+			try:
+				warmed, spent = await asyncio.to_thread(warm_caches)
+				print(f"🔥 Cache warmed for {warmed} sets using {spent} upstream calls.")
+			except Exception as e:
+				print(f"⚠️ Cache warm-up failed: {e}")
+
+		await asyncio.sleep(POPULARITY_FLUSH_SECONDS)
@@ -0,0 +1,292 @@
+# catalog_mirror.py
+
+"""
+Локальное зеркало каталога Rebrickable:
+- Импорт bulk CSV-выгрузок (sets, inventories, inventory_parts, parts, colors, part_categories, themes)
+- Потоковая загрузка (gzip → COPY) без чтения файлов целиком в память
+- Новая версия таблицы собирается рядом и подменяет старую (RENAME), не блокируя чтение
+- Инкрементальная перезагрузка по ETag / Last-Modified
+- Чтение набора, его деталей и категорий из зеркала
+"""
+
+import os
+import csv
+import gzip
+import asyncio
+import requests
+import psycopg2
+from psycopg2 import sql
+from datetime import datetime
+from db import DATABASE_URL
+
+# Откуда брать выгрузки: CDN Rebrickable или локальная папка (например, с тестовыми CSV)
+CATALOG_DOWNLOAD_URL = os.getenv("CATALOG_DOWNLOAD_URL", "https://cdn.rebrickable.com/media/downloads")
+CATALOG_CSV_DIR = os.getenv("CATALOG_CSV_DIR")
+
+# Интервал перезагрузки зеркала (в часах) — Rebrickable обновляет выгрузки раз в сутки
+CATALOG_REFRESH_HOURS = float(os.getenv("CATALOG_REFRESH_HOURS", "24"))
+
+# Описание выгрузок: имя файла → (таблица, [(колонка, SQL-тип)])
+# Загружаются только перечисленные колонки, лишние колонки в CSV игнорируются.
+CATALOG_FILES = {
+	"colors": ("rb_colors", [
+		("id", "INTEGER"), ("name", "TEXT"), ("rgb", "TEXT"), ("is_trans", "BOOLEAN"),
+	]),
+	"part_categories": ("rb_part_categories", [
+		("id", "INTEGER"), ("name", "TEXT"),
+	]),
+	"parts": ("rb_parts", [
+		("part_num", "TEXT"), ("name", "TEXT"), ("part_cat_id", "INTEGER"),
+	]),
+	"themes": ("rb_themes", [
+		("id", "INTEGER"), ("name", "TEXT"), ("parent_id", "INTEGER"),
+	]),
+	"sets": ("rb_sets", [
+		("set_num", "TEXT"), ("name", "TEXT"), ("year", "INTEGER"),
+		("theme_id", "INTEGER"), ("num_parts", "INTEGER"), ("img_url", "TEXT"),
+	]),
+	"inventories": ("rb_inventories", [
+		("id", "INTEGER"), ("version", "INTEGER"), ("set_num", "TEXT"),
+	]),
+	"inventory_parts": ("rb_inventory_parts", [
+		("inventory_id", "INTEGER"), ("part_num", "TEXT"), ("color_id", "INTEGER"),
+		("quantity", "INTEGER"), ("is_spare", "BOOLEAN"),
+	]),
+}
+
+# ============================
+# 📂 Открытие выгрузки (CDN или локальный файл)
+# ============================
+def open_local_csv(path):
+	"""
+	Открывает локальный CSV (.csv или .csv.gz) как бинарный поток.
+	"""
+	if path.endswith(".gz"):
+		return gzip.open(path, "rb")
+	return open(path, "rb")
+
+def find_local_csv(directory, name):
+	"""
+	Ищет в папке файл выгрузки name.csv.gz или name.csv.
+	Возвращает путь или None.
+	"""
+	for filename in (f"{name}.csv.gz", f"{name}.csv"):
+		path = os.path.join(directory, filename)
+		if os.path.exists(path):
+			return path
+	return None
+
+# ============================
+# 📥 Загрузка одного файла через COPY
+# ============================
+def copy_csv_into_table(conn, name, stream):
+	"""
+	Загружает CSV-поток в таблицу зеркала.
+	Данные через COPY попадают во временную staging-таблицу (все колонки TEXT),
+	затем с приведением типов — в новую таблицу {table}_new (той же структуры, с индексами).
+	В конце новая таблица подменяет старую через ALTER TABLE ... RENAME в той же транзакции.
+	Пока идёт загрузка, читатели работают со старой таблицей без блокировок;
+	эксклюзивная блокировка берётся только на короткую подмену перед коммитом.
+	Возвращает количество загруженных строк.
+	"""
+	table, columns = CATALOG_FILES[name]
+	header = next(csv.reader([stream.readline().decode("utf-8-sig")]))
+	header = [col.strip() for col in header]
+	missing = [col for col, _ in columns if col not in header]
+	if missing:
+		raise ValueError(f"{name}.csv: missing columns {missing}")
+
+	stage = sql.Identifier(f"stage_{name}")
+	target = sql.Identifier(table)
+	new_table = sql.Identifier(f"{table}_new")
+	old_table = sql.Identifier(f"{table}_old")
+	with conn.cursor() as cur:
+		cur.execute(sql.SQL("CREATE TEMP TABLE {} ({}) ON COMMIT DROP").format(
+			stage,
+			sql.SQL(", ").join(sql.SQL("{} TEXT").format(sql.Identifier(col)) for col in header)
+		))
+		# Заголовок уже прочитан — дальше COPY читает поток как есть, без буферизации в Python
+		cur.copy_expert(
+			sql.SQL("COPY {} FROM STDIN WITH (FORMAT csv)").format(stage).as_string(conn),
+			stream
+		)
+
+		# Остатки прерванной загрузки, если они есть
+		cur.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(new_table))
+		cur.execute(sql.SQL("CREATE TABLE {} (LIKE {} INCLUDING ALL)").format(new_table, target))
+		cur.execute(sql.SQL("INSERT INTO {} ({}) SELECT {} FROM {}").format(
+			new_table,
+			sql.SQL(", ").join(sql.Identifier(col) for col, _ in columns),
+			sql.SQL(", ").join(
+				sql.SQL("NULLIF({}, '')::{}").format(sql.Identifier(col), sql.SQL(col_type))
+				for col, col_type in columns
+			),
+			stage
+		))
+		row_count = cur.rowcount
+
+		cur.execute(sql.SQL("ALTER TABLE {} RENAME TO {}").format(target, old_table))
+		cur.execute(sql.SQL("ALTER TABLE {} RENAME TO {}").format(new_table, target))
+		cur.execute(sql.SQL("DROP TABLE {}").format(old_table))
+	return row_count
+
+def save_import_state(conn, name, etag, last_modified, row_count):
+	"""
+	Запоминает ETag / Last-Modified загруженного файла.
+	"""
+	with conn.cursor() as cur:
+		cur.execute("""
+			INSERT INTO rb_import_state (name, etag, last_modified, row_count, imported_at)
+			VALUES (%s, %s, %s, %s, %s)
+			ON CONFLICT (name) DO UPDATE
+			SET etag = EXCLUDED.etag,
+				last_modified = EXCLUDED.last_modified,
+				row_count = EXCLUDED.row_count,
+				imported_at = EXCLUDED.imported_at
+		""", (name, etag, last_modified, row_count, datetime.utcnow()))
+
+def load_import_state(conn):
+	"""
+	Возвращает словарь { name: (etag, last_modified) } по всем ранее загруженным файлам.
+	"""
+	with conn.cursor() as cur:
+		cur.execute("SELECT name, etag, last_modified FROM rb_import_state")
+		return {row[0]: (row[1], row[2]) for row in cur.fetchall()}
+
+# ============================
+# 🔄 Импорт всех выгрузок
+# ============================
+def import_from_directory(directory, names=None):
+	"""
+	Импортирует выгрузки из локальной папки (name.csv или name.csv.gz).
+	Файлы, которых нет в папке, пропускаются.
+	Возвращает словарь { name: количество строк }.
+	"""
+	result = {}
+	with psycopg2.connect(DATABASE_URL) as conn:
+		for name in names or CATALOG_FILES:
+			path = find_local_csv(directory, name)
+			if not path:
+				continue
+			with open_local_csv(path) as stream:
+				result[name] = copy_csv_into_table(conn, name, stream)
+			save_import_state(conn, name, None, None, result[name])
+			conn.commit()
+	return result
+
+def import_from_rebrickable(names=None):
+	"""
+	Скачивает выгрузки с CDN Rebrickable и загружает их в зеркало.
+	Перезагрузка инкрементальная: файл запрашивается с If-None-Match / If-Modified-Since
+	и при ответе 304 пропускается.
+	Возвращает словарь { name: количество строк } только по обновлённым файлам.
+	"""
+	result = {}
+	with psycopg2.connect(DATABASE_URL) as conn:
+		state = load_import_state(conn)
+		for name in names or CATALOG_FILES:
+			etag, last_modified = state.get(name, (None, None))
+			headers = {}
+			if etag:
+				headers["If-None-Match"] = etag
+			if last_modified:
+				headers["If-Modified-Since"] = last_modified
+
+			url = f"{CATALOG_DOWNLOAD_URL}/{name}.csv.gz"
+			with requests.get(url, headers=headers, stream=True, timeout=60) as response:
+				if response.status_code == 304:
+					continue
+				if response.status_code != 200:
+					print(f"⚠️ Catalog download {name} failed: {response.status_code}")
+					continue
+				with gzip.GzipFile(fileobj=response.raw) as stream:
+					result[name] = copy_csv_into_table(conn, name, stream)
+				save_import_state(
+					conn, name,
+					response.headers.get("ETag"),
+					response.headers.get("Last-Modified"),
+					result[name]
+				)
+			conn.commit()
+	return result
+
+def refresh_catalog_mirror():
+	"""
+	Обновляет зеркало из CATALOG_CSV_DIR (если задана) или с CDN Rebrickable.
+	"""
+	if CATALOG_CSV_DIR:
+		return import_from_directory(CATALOG_CSV_DIR)
+	return import_from_rebrickable()
+
+async def catalog_mirror_loop():
+	"""
+	Фоновая задача: перезагружает зеркало каталога раз в CATALOG_REFRESH_HOURS.
+	Импорт выполняется в отдельном потоке, чтобы не блокировать event loop бота.
+	"""
+	print(f"📚 Catalog mirror job started with interval {CATALOG_REFRESH_HOURS} hours...")
+	while True:
+		try:
+			updated = await asyncio.to_thread(refresh_catalog_mirror)
+			if updated:
+				print(f"📚 Catalog mirror updated: {updated}")
+			else:
+				print("📚 Catalog mirror is up to date.")
+		except Exception as e:
+			print(f"⚠️ Catalog mirror refresh failed: {e}")
+		await asyncio.sleep(CATALOG_REFRESH_HOURS * 3600)
+
+# ============================
+# 🔎 Чтение из зеркала
+# ============================
+def mirror_get_set_details(set_id):
+	"""
+	Возвращает (set_num, name, year, num_parts) из зеркала или None, если набора нет.
+	"""
+	with psycopg2.connect(DATABASE_URL) as conn:
+		with conn.cursor() as cur:
+			cur.execute(
+				"SELECT set_num, name, year, num_parts FROM rb_sets WHERE set_num = %s",
+				(set_id,)
+			)
+			row = cur.fetchone()
+	return tuple(row) if row else None
+
+def mirror_get_all_parts(set_id):
+	"""
+	Возвращает детали последней версии инвентаря набора в формате Rebrickable API
+	(part / color / quantity / is_spare), либо пустой список, если инвентаря нет в зеркале.
+	"""
+	with psycopg2.connect(DATABASE_URL) as conn:
+		with conn.cursor() as cur:
+			cur.execute("""
+				SELECT ip.part_num, p.name, p.part_cat_id, ip.color_id, c.name, ip.quantity, ip.is_spare
+				FROM rb_inventory_parts ip
+				LEFT JOIN rb_parts p ON p.part_num = ip.part_num
+				LEFT JOIN rb_colors c ON c.id = ip.color_id
+				WHERE ip.inventory_id = (
+					SELECT id FROM rb_inventories
+					WHERE set_num = %s
+					ORDER BY version DESC
+					LIMIT 1
+				)
+				ORDER BY ip.part_num, ip.color_id, ip.is_spare
+			""", (set_id,))
+			rows = cur.fetchall()
+	return [
+		{
+			"part": {"part_num": part_num, "name": part_name, "part_cat_id": part_cat_id},
+			"color": {"id": color_id, "name": color_name or "Unknown"},
+			"quantity": quantity,
+			"is_spare": is_spare,
+		}
+		for part_num, part_name, part_cat_id, color_id, color_name, quantity, is_spare in rows
+	]
+
+def mirror_get_categories():
+	"""
+	Возвращает { category_id: category_name } из зеркала (пустой словарь, если зеркало не загружено).
+	"""
+	with psycopg2.connect(DATABASE_URL) as conn:
+		with conn.cursor() as cur:
+			cur.execute("SELECT id, name FROM rb_part_categories")
+			return dict(cur.fetchall())
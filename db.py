@@ -2,19 +2,182 @@
 
 import os
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values, Json
 from datetime import datetime
 
 # Получаем URL подключения к PostgreSQL из переменной окружения Railway
 DATABASE_URL = os.environ["DATABASE_URL"]
 
+# ============================
+# 🧬 МИГРАЦИИ СХЕМЫ
+# ============================
+# Упорядоченный список шагов: (версия, [SQL-запросы]).
+# Новые таблицы и индексы добавляются только новым шагом в конец списка —
+# уже применённые шаги никогда не редактируются.
+MIGRATIONS = [
+	(1, [
+		# Таблица сообщений
+		"""
+		CREATE TABLE IF NOT EXISTS messages (
+			id SERIAL PRIMARY KEY,
+			title TEXT,
+			content TEXT NOT NULL,
+			send_at TIMESTAMP NOT NULL,
+			sent BOOLEAN DEFAULT FALSE
+		)
+		""",
+		# Таблица пользователей
+		"""
+		CREATE TABLE IF NOT EXISTS users (
+			user_id BIGINT PRIMARY KEY,
+			username TEXT,
+			first_name TEXT,
+			last_name TEXT,
+			language_code TEXT,
+			is_bot BOOLEAN,
+			is_premium BOOLEAN,
+			subscribed BOOLEAN DEFAULT TRUE,
+			started_at TIMESTAMP NOT NULL,
+			blocked BOOLEAN DEFAULT FALSE
+		)
+		""",
+	]),
+	(2, [
+		# get_pending_messages: sent = FALSE AND send_at <= ...
+		"""
+		CREATE INDEX IF NOT EXISTS messages_pending_idx
+			ON messages (send_at)
+			WHERE sent = FALSE
+		""",
+		# get_subscribed_users: subscribed = TRUE AND blocked = FALSE
+		"""
+		CREATE INDEX IF NOT EXISTS users_subscribed_idx
+			ON users (user_id)
+			WHERE subscribed = TRUE AND blocked = FALSE
+		""",
+	]),
+	(3, [
+		# Локальное зеркало каталога Rebrickable (см. catalog_mirror.py)
+		"""
+		CREATE TABLE IF NOT EXISTS rb_colors (
+			id INTEGER PRIMARY KEY,
+			name TEXT NOT NULL,
+			rgb TEXT,
+			is_trans BOOLEAN
+		)
+		""",
+		"""
+		CREATE TABLE IF NOT EXISTS rb_part_categories (
+			id INTEGER PRIMARY KEY,
+			name TEXT NOT NULL
+		)
+		""",
+		"""
+		CREATE TABLE IF NOT EXISTS rb_parts (
+			part_num TEXT PRIMARY KEY,
+			name TEXT NOT NULL,
+			part_cat_id INTEGER
+		)
+		""",
+		"""
+		CREATE TABLE IF NOT EXISTS rb_themes (
+			id INTEGER PRIMARY KEY,
+			name TEXT NOT NULL,
+			parent_id INTEGER
+		)
+		""",
+		"""
+		CREATE TABLE IF NOT EXISTS rb_sets (
+			set_num TEXT PRIMARY KEY,
+			name TEXT NOT NULL,
+			year INTEGER,
+			theme_id INTEGER,
+			num_parts INTEGER,
+			img_url TEXT
+		)
+		""",
+		"""
+		CREATE TABLE IF NOT EXISTS rb_inventories (
+			id INTEGER PRIMARY KEY,
+			version INTEGER NOT NULL,
+			set_num TEXT NOT NULL
+		)
+		""",
+		"""
+		CREATE TABLE IF NOT EXISTS rb_inventory_parts (
+			inventory_id INTEGER NOT NULL,
+			part_num TEXT NOT NULL,
+			color_id INTEGER NOT NULL,
+			quantity INTEGER NOT NULL,
+			is_spare BOOLEAN NOT NULL DEFAULT FALSE
+		)
+		""",
+		# Состояние импорта: ETag / Last-Modified каждого файла для инкрементальной перезагрузки
+		"""
+		CREATE TABLE IF NOT EXISTS rb_import_state (
+			name TEXT PRIMARY KEY,
+			etag TEXT,
+			last_modified TEXT,
+			row_count INTEGER,
+			imported_at TIMESTAMP NOT NULL
+		)
+		""",
+		"CREATE INDEX IF NOT EXISTS rb_inventories_set_idx ON rb_inventories (set_num, version DESC)",
+		"CREATE INDEX IF NOT EXISTS rb_inventory_parts_inv_idx ON rb_inventory_parts (inventory_id)",
+	]),
+	(4, [
+		# Популярность наборов: log_score хранится приведённым к фиксированной эпохе
+		# (см. popularity.py), поэтому порядок по нему не зависит от текущего времени
+		"""
+		CREATE TABLE IF NOT EXISTS set_popularity (
+			set_id TEXT PRIMARY KEY,
+			log_score DOUBLE PRECISION NOT NULL,
+			last_seen_at TIMESTAMP NOT NULL
+		)
+		""",
+		"CREATE INDEX IF NOT EXISTS set_popularity_score_idx ON set_popularity (log_score DESC)",
+	]),
+	(5, [
+		# История цен BrickEconomy (см. price_history.py); data — полный ответ для отображения
+		"""
+		CREATE TABLE IF NOT EXISTS price_snapshots (
+			set_num TEXT NOT NULL,
+			taken_at TIMESTAMP NOT NULL,
+			value_new DOUBLE PRECISION,
+			value_used DOUBLE PRECISION,
+			retail_us DOUBLE PRECISION,
+			retail_eu DOUBLE PRECISION,
+			forecast_2y DOUBLE PRECISION,
+			forecast_5y DOUBLE PRECISION,
+			data JSONB NOT NULL,
+			PRIMARY KEY (set_num, taken_at)
+		)
+		""",
+	]),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version(cur) -> int:
+	"""
+	Возвращает текущую версию схемы (0, если таблица schema_version ещё не создана).
+	"""
+	cur.execute("SELECT to_regclass('schema_version')")
+	if cur.fetchone()[0] is None:
+		return 0
+	cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+	return cur.fetchone()[0]
+
 # ============================
 # 📦 ФУНКЦИЯ: ИНИЦИАЛИЗАЦИЯ БАЗЫ
 # ============================
 def init_db():
 	"""
-	Создаёт таблицу messages и users, если они ещё не существуют.
-	Таблица содержит:
+	Приводит схему базы к актуальной версии.
+	Если версия в schema_version уже равна SCHEMA_VERSION — DDL не выполняется вовсе.
+	Иначе по порядку применяются недостающие шаги из MIGRATIONS
+	(в одной транзакции, с записью номера версии после каждого шага).
+	Таблица messages:
 	- id: уникальный идентификатор
 	- title: заголовок сообщения (необязательный)
 	- content: HTML-сообщение для отправки
@@ -23,31 +186,26 @@ def init_db():
 	"""
 	with psycopg2.connect(DATABASE_URL) as conn:
 		with conn.cursor() as cur:
-			# Таблица сообщений
-			cur.execute("""
-				CREATE TABLE IF NOT EXISTS messages (
-					id SERIAL PRIMARY KEY,
-					title TEXT,
-					content TEXT NOT NULL,
-					send_at TIMESTAMP NOT NULL,
-					sent BOOLEAN DEFAULT FALSE
-				)
-			""")
-			# Таблица пользователей
+			current = get_schema_version(cur)
+			if current >= SCHEMA_VERSION:
+				return
+
+			# Блокировка на случай одновременного старта нескольких инстансов
+			cur.execute("SELECT pg_advisory_xact_lock(hashtext('rebrickbot_schema'))")
 			cur.execute("""
-				CREATE TABLE IF NOT EXISTS users (
-					user_id BIGINT PRIMARY KEY,
-					username TEXT,
-					first_name TEXT,
-					last_name TEXT,
-					language_code TEXT,
-					is_bot BOOLEAN,
-					is_premium BOOLEAN,
-					subscribed BOOLEAN DEFAULT TRUE,
-					started_at TIMESTAMP NOT NULL,
-					blocked BOOLEAN DEFAULT FALSE
+				CREATE TABLE IF NOT EXISTS schema_version (
+					version INTEGER PRIMARY KEY,
+					applied_at TIMESTAMP NOT NULL DEFAULT (NOW() AT TIME ZONE 'utc')
 				)
 			""")
+			current = get_schema_version(cur)
+			for version, statements in MIGRATIONS:
+				if version <= current:
+					continue
+				for sql in statements:
+					cur.execute(sql)
+				cur.execute("INSERT INTO schema_version (version) VALUES (%s)", (version,))
+				print(f"🧬 Applied DB migration v{version}")
 		conn.commit()
 
 # ============================
@@ -169,3 +327,106 @@ def get_subscribed_users():
 				"SELECT user_id, username FROM users WHERE subscribed = TRUE AND blocked = FALSE"
 			)
 			return cur.fetchall()
+
+# ============================
+# 🔥 ПОПУЛЯРНОСТЬ НАБОРОВ
+# ============================
+def add_set_popularity(increments: dict, seen_at: datetime):
+	"""
+	Пакетно увеличивает счётчики популярности наборов.
+	increments — словарь { set_id: логарифм прибавки к score }.
+	Сложение в логарифмах: ln(e^a + e^b) = max(a, b) + ln(1 + e^-|a - b|)
+	(разница ограничена 700, чтобы EXP не давал ошибку underflow).
+	"""
+	if not increments:
+		return
+	with psycopg2.connect(DATABASE_URL) as conn:
+		with conn.cursor() as cur:
+			execute_values(cur, """
+				INSERT INTO set_popularity (set_id, log_score, last_seen_at)
+				VALUES %s
+				ON CONFLICT (set_id) DO UPDATE
+				SET log_score = GREATEST(set_popularity.log_score, EXCLUDED.log_score)
+						+ LN(1 + EXP(-LEAST(ABS(set_popularity.log_score - EXCLUDED.log_score), 700))),
+					last_seen_at = EXCLUDED.last_seen_at
+			""", [(set_id, log_score, seen_at) for set_id, log_score in increments.items()])
+		conn.commit()
+
+def get_popular_sets(limit: int):
+	"""
+	Возвращает номера самых популярных наборов (по убыванию затухающего счётчика).
+	"""
+	with psycopg2.connect(DATABASE_URL) as conn:
+		with conn.cursor() as cur:
+			cur.execute(
+				"SELECT set_id FROM set_popularity ORDER BY log_score DESC LIMIT %s",
+				(limit,)
+			)
+			return [row[0] for row in cur.fetchall()]
+
+# ============================
+# 📈 ИСТОРИЯ ЦЕН
+# ============================
+def add_price_snapshots(snapshots):
+	"""
+	Пакетно сохраняет снимки цен.
+	snapshots — список кортежей (set_num, taken_at, data), где data — ответ BrickEconomy.
+	"""
+	if not snapshots:
+		return
+	rows = [
+		(
+			set_num, taken_at,
+			data.get("current_value_new"),
+			data.get("current_value_used"),
+			data.get("retail_price_us"),
+			data.get("retail_price_eu"),
+			data.get("forecast_value_new_2_years"),
+			data.get("forecast_value_new_5_years"),
+			Json(data),
+		)
+		for set_num, taken_at, data in snapshots
+	]
+	with psycopg2.connect(DATABASE_URL) as conn:
+		with conn.cursor() as cur:
+			execute_values(cur, """
+				INSERT INTO price_snapshots (
+					set_num, taken_at, value_new, value_used,
+					retail_us, retail_eu, forecast_2y, forecast_5y, data
+				)
+				VALUES %s
+				ON CONFLICT (set_num, taken_at) DO NOTHING
+			""", rows)
+		conn.commit()
+
+def get_latest_price_snapshot(set_num: str, before: datetime = None):
+	"""
+	Возвращает последний снимок цен набора (не позже before, если передан) или None.
+	"""
+	with psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor) as conn:
+		with conn.cursor() as cur:
+			cur.execute("""
+				SELECT * FROM price_snapshots
+				WHERE set_num = %s AND taken_at <= %s
+				ORDER BY taken_at DESC
+				LIMIT 1
+			""", (set_num, before or datetime.utcnow()))
+			return cur.fetchone()
+
+def get_sets_for_price_refresh(refreshed_before: datetime, limit: int):
+	"""
+	Возвращает отслеживаемые наборы (все, что есть в set_popularity) без снимка цен
+	новее refreshed_before — самые популярные первыми.
+	"""
+	with psycopg2.connect(DATABASE_URL) as conn:
+		with conn.cursor() as cur:
+			cur.execute("""
+				SELECT p.set_id FROM set_popularity p
+				WHERE NOT EXISTS (
+					SELECT 1 FROM price_snapshots s
+					WHERE s.set_num = p.set_id AND s.taken_at > %s
+				)
+				ORDER BY p.log_score DESC
+				LIMIT %s
+			""", (refreshed_before, limit))
+			return [row[0] for row in cur.fetchall()]
@@ -1,16 +1,27 @@
 # handlers.py
 
 import re
-import os
 import requests
 import io
+import html
+import asyncio
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton, InputFile
 from telegram.ext import ContextTypes
-from api_brickeconomy import get_pricing_info # работа с api сайта BrickEconomy
-from api_rebrickable import get_set_details, get_all_parts, get_categories # работа с api сайта rebrickable
+from price_history import get_pricing_view # цены BrickEconomy из сохранённой истории
+from api_rebrickable import (
+	get_set_data, get_set_details, get_all_parts, get_categories, REBRICKABLE_CACHE_TTL_HOURS
+) # работа с api сайта rebrickable
+from cache import TTLCache # in-process кеш ответов
 from analytics import track_command, track_feature, track_callback # логирование действий в GA с user_props
 from db import get_recent_messages, add_or_update_user # работа с базой данных
 from newsletter import format_newsletter_message # работа с рассылкой новостей
+from search_index import get_search_index # поиск наборов по названию
+from batch_lookup import (
+	BATCH_MAX_CODES, BATCH_TABLE_MAX_ROWS,
+	extract_set_codes, extract_set_codes_from_csv, lookup_sets, format_batch_table, format_totals, build_batch_csv
+) # пакетный поиск списка наборов
+from inventory_index import get_set_inventory, format_comparison # сравнение наборов по деталям
+from popularity import record_set_query # счётчик популярности наборов для прогрева кеша
 
 def get_lego_us_url(set_num):
 	"""
@@ -22,17 +33,27 @@ def get_lego_us_url(set_num):
 	base = set_num.split("-")[0]
 	return f"https://www.lego.com/en-us/product/{base}"
 
-def build_inline_keyboard(set_id: str, set_url: str, lego_us_url: str) -> InlineKeyboardMarkup:
+# Размер страницы для сводок по цветам/типам (строк на одно сообщение).
+# 40 строк гарантированно укладываются в лимит Telegram в 4096 символов.
+SUMMARY_PAGE_SIZE = 40
+
+# Кеш отсортированных сводок: {(action, set_id): [(name, total), ...]}
+summary_cache = TTLCache(max_items=512, ttl_seconds=REBRICKABLE_CACHE_TTL_HOURS * 3600)
+
+def build_inline_keyboard(set_id: str, set_url: str, lego_us_url: str, nav_row: list = None) -> InlineKeyboardMarkup:
 	"""
-	Создаёт InlineKeyboard с кнопками для отображения деталей по цветам, типам, ценам и ссылками на Rebrickable и официальный сайт LEGO.
+	Создаёт InlineKeyboard с кнопками для отображения деталей по цветам, типам, ценам, сравнения наборов и ссылками на Rebrickable и официальный сайт LEGO.
+	Если передан nav_row — первой строкой добавляются кнопки листания страниц.
 	"""
-	return InlineKeyboardMarkup([
+	rows = [nav_row] if nav_row else []
+	return InlineKeyboardMarkup(rows + [
 		[
 			InlineKeyboardButton("Parts by Color", callback_data=f"parts_by_color:{set_id}"),
 			InlineKeyboardButton("Parts by Type", callback_data=f"parts_by_type:{set_id}")
 		],
 		[
-			InlineKeyboardButton("View Prices", callback_data=f"pricing:{set_id}")
+			InlineKeyboardButton("View Prices", callback_data=f"pricing:{set_id}"),
+			InlineKeyboardButton("Compare Sets", callback_data=f"compare:{set_id}")
 		],
 		[
 			InlineKeyboardButton("View on Rebrickable", url=set_url)
@@ -58,6 +79,66 @@ def group_parts_by_dynamic_category(parts):
 			category_summary[cat_name] = category_summary.get(cat_name, 0) + quantity
 	return category_summary
 
+def summarize_parts_by_color(parts):
+	"""
+	Суммирует количество деталей по цветам.
+	Возвращает словарь: {название цвета: количество деталей}
+	"""
+	color_summary = {}
+	for part in parts:
+		color = part.get("color", {})
+		color_name = color.get("name", "Unknown")
+		quantity = part.get("quantity", 0)
+		color_summary[color_name] = color_summary.get(color_name, 0) + quantity
+	return color_summary
+
+def get_sorted_summary(action: str, set_id: str):
+	"""
+	Возвращает отсортированную сводку [(name, total), ...] для parts_by_color / parts_by_type.
+	Сводка считается один раз на набор и хранится в кеше, поэтому
+	листание страниц не перезагружает инвентарь и не пересчитывает агрегаты.
+	Возвращает None, если детали получить не удалось (результат не кешируется).
+	"""
+	key = (action, set_id)
+	rows = summary_cache.get(key)
+	if rows is not None:
+		return rows
+
+	parts = get_all_parts(set_id)
+	if not parts:
+		return None
+	if action == "parts_by_color":
+		summary = summarize_parts_by_color(parts)
+	else:
+		summary = group_parts_by_dynamic_category(parts)
+	rows = sorted(summary.items(), key=lambda x: x[1], reverse=True)
+
+	summary_cache.set(key, rows)
+	return rows
+
+def build_summary_page(title: str, rows, action: str, set_id: str, page: int):
+	"""
+	Формирует текст одной страницы сводки и строку кнопок навигации.
+	Возвращает кортеж (text, nav_row); nav_row пустой, если страница одна.
+	"""
+	total_pages = max(1, (len(rows) + SUMMARY_PAGE_SIZE - 1) // SUMMARY_PAGE_SIZE)
+	page = min(max(page, 0), total_pages - 1)
+	start = page * SUMMARY_PAGE_SIZE
+
+	header = f"\n<b>{title}:</b>"
+	if total_pages > 1:
+		header += f" <i>(page {page + 1}/{total_pages})</i>"
+	lines = [header]
+	for name, total in rows[start:start + SUMMARY_PAGE_SIZE]:
+		lines.append(f"<b>{name}</b>: {total}")
+
+	nav_row = []
+	if page > 0:
+		nav_row.append(InlineKeyboardButton("◀️ Prev", callback_data=f"{action}:{set_id}:{page - 1}"))
+	if page < total_pages - 1:
+		nav_row.append(InlineKeyboardButton("Next ▶️", callback_data=f"{action}:{set_id}:{page + 1}"))
+	return "\n".join(lines), nav_row
+
 # ========================
 # Команда /start
 # ========================
@@ -71,7 +152,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 		language_code=user.language_code
 	)
 	await update.message.reply_text(
-		"Hello! Please send me a Lego set code (4 or 5 digits).",
+		"Hello! Please send me a Lego set code (4 or 5 digits) or a set name.",
 		parse_mode="HTML"
 	)
 
@@ -86,6 +167,106 @@ async def newsletters(update: Update, context: ContextTypes.DEFAULT_TYPE):
 	formatted = [format_newsletter_message(msg) for msg in messages]
 	await update.message.reply_text("\n\n".join(formatted), parse_mode="HTML")
 
+# ========================
+# Карточка набора
+# ========================
+def format_set_card(set_num, name, year, num_parts) -> str:
+	"""
+	Формирует HTML-текст карточки набора (номер, название, год, количество деталей).
+	"""
+	return (
+		f"<b>Set Number:</b> {set_num}\n"
+		f"<b>Name:</b> {name}\n"
+		f"<b>Year Released:</b> {year}\n"
+		f"<b>Pieces:</b> {num_parts}"
+	)
+
+async def send_set_card(message, set_id: str):
+	"""
+	Загружает набор из Rebrickable (через кеш) и отправляет в ответ на message фото и карточку с inline-кнопками.
+	Возвращает True, если набор найден и карточка отправлена.
+	"""
+	status_code, data = await asyncio.to_thread(get_set_data, set_id)
+
+	if status_code != 200:
+		if status_code == 404:
+			await message.reply_text(f"❌ LEGO set {set_id} not found.")
+		else:
+			await message.reply_text(f"⚠️ API Error: {status_code}")
+		return False
+
+	set_num = data.get("set_num", "n/a")
+	name = data.get("name", "n/a")
+	year = data.get("year", "n/a")
+	num_parts = data.get("num_parts", "n/a")
+	set_img_url = data.get("set_img_url")
+	set_url = data.get("set_url", "n/a")
+
+	text = format_set_card(set_num, name, year, num_parts)
+
+	if set_img_url:
+		try:
+			img_head = requests.head(set_img_url, allow_redirects=True, timeout=5)
+			size = int(img_head.headers.get("Content-Length", 0))
+			if size <= 5_000_000:
+				await message.reply_photo(photo=set_img_url)
+			else:
+				img_data = requests.get(set_img_url, timeout=10).content
+				await message.reply_photo(photo=InputFile(io.BytesIO(img_data), filename="lego.jpg"))
+		except Exception as e:
+			print(f"❌ Failed to send photo: {e}")
+
+	keyboard = build_inline_keyboard(set_id, set_url, get_lego_us_url(set_num))
+	await message.reply_text(text=text, parse_mode="HTML", reply_markup=keyboard)
+	return True
+
+def build_search_keyboard(results) -> InlineKeyboardMarkup:
+	"""
+	Создаёт InlineKeyboard с найденными наборами: одна кнопка на набор, открывает его карточку.
+	"""
+	return InlineKeyboardMarkup([
+		[InlineKeyboardButton(f"{set_num} · {name} ({year})", callback_data=f"open_set:{set_num}")]
+		for set_num, name, year, theme in results
+	])
+
+# ========================
+# Сравнение наборов по деталям
+# ========================
+async def reply_comparison(message, codes):
+	"""
+	Загружает (или берёт из кеша) индексы инвентарей наборов параллельно и отвечает отчётом сравнения.
+	Отчёт может занимать несколько сообщений, каждое в пределах лимита Telegram.
+	"""
+	await message.reply_text(f"⏳ Comparing {', '.join(codes)}...")
+	inventories = await asyncio.gather(*(asyncio.to_thread(get_set_inventory, code) for code in codes))
+	missing = [code for code, inv in zip(codes, inventories) if inv is None]
+	if missing:
+		await message.reply_text(f"⚠️ No parts data found for {', '.join(missing)}.")
+		return
+	for text in format_comparison(inventories):
+		await message.reply_text(text, parse_mode="HTML")
+
+# Максимум наборов в одном сравнении
+COMPARE_MAX_SETS = 5
+
+async def compare(update: Update, context: ContextTypes.DEFAULT_TYPE):
+	"""
+	Команда /compare 42176 42115 ... — сравнение двух и более наборов.
+	Первый набор считается целевым: для него показывается, чего не хватает в остальных.
+	"""
+	user = update.effective_user
+	track_command(
+		user.id,
+		"compare",
+		username=user.username,
+		language_code=user.language_code
+	)
+	codes = extract_set_codes(" ".join(context.args))[:COMPARE_MAX_SETS]
+	if len(codes) < 2:
+		await update.message.reply_text("Usage: /compare <set> <set> [...] — e.g. /compare 42176 42115")
+		return
+	await reply_comparison(update.message, codes)
+
 # ========================
 # Обработка ввода LEGO-кода
 # ========================
@@ -99,55 +280,101 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
 		language_code=user.language_code
 	)
 
+	codes = extract_set_codes(text)
+
+	# Ответ на кнопку "Compare Sets": сравниваем выбранный набор с присланными
+	compare_base = context.user_data.pop("compare_base", None)
+	if compare_base and codes:
+		codes = [code for code in codes if code != compare_base]
+		if not codes:
+			await update.message.reply_text(f"❌ Please send a set code other than {compare_base}.")
+			return
+		await reply_comparison(update.message, [compare_base] + codes[:COMPARE_MAX_SETS - 1])
+		return
+
+	# Несколько кодов в одном сообщении (например, вставленный вишлист)
+	if len(codes) > 1:
+		await reply_batch_lookup(update.message, codes)
+		return
+
 	match = re.fullmatch(r"(\d{4,5})(-\d)?", text)
 	if not match:
-		await update.message.reply_text("❌ Invalid LEGO code. Please enter exactly 4 or 5 digits.")
+		# Не код — пробуем найти набор по названию / теме в локальном индексе
+		index = get_search_index()
+		results = index.search(text) if index else []
+		if not results:
+			await update.message.reply_text("❌ Invalid LEGO code. Please enter exactly 4 or 5 digits or a set name.")
+			return
+		await update.message.reply_text(
+			f"🔎 Sets matching <b>{html.escape(text)}</b>:",
+			parse_mode="HTML",
+			reply_markup=build_search_keyboard(results)
+		)
 		return
 
 	base = match.group(1)
 	suffix = match.group(2) or "-1"
 	set_id = f"{base}{suffix}"
+	# В популярность попадают только существующие наборы — опечатки не тратят квоты прогрева и цен
+	if await send_set_card(update.message, set_id):
+		record_set_query(set_id)
 
-	url = f"https://rebrickable.com/api/v3/lego/sets/{set_id}/"
-	headers = {"Authorization": f"key {os.environ['REBRICKABLE_API_KEY']}"}
-	response = requests.get(url, headers=headers)
+# ========================
+# Пакетный поиск списка наборов
+# ========================
+async def reply_batch_lookup(message, codes):
+	"""
+	Параллельно запрашивает наборы из списка и отвечает таблицей
+	или CSV-документом, если наборов больше BATCH_TABLE_MAX_ROWS.
+	"""
+	skipped = len(codes) - BATCH_MAX_CODES
+	codes = codes[:BATCH_MAX_CODES]
+	await message.reply_text(f"⏳ Looking up {len(codes)} sets...")
 
-	if response.status_code != 200:
-		if response.status_code == 404:
-			await update.message.reply_text(f"❌ LEGO set {set_id} not found.")
-		else:
-			await update.message.reply_text(f"⚠️ API Error: {response.status_code}")
-		return
+	rows = await lookup_sets(codes)
+	note = f"\n⚠️ Only the first {BATCH_MAX_CODES} codes were processed." if skipped > 0 else ""
 
-	data = response.json()
-	set_num = data.get("set_num", "n/a")
-	name = data.get("name", "n/a")
-	year = data.get("year", "n/a")
-	num_parts = data.get("num_parts", "n/a")
-	set_img_url = data.get("set_img_url")
-	set_url = data.get("set_url", "n/a")
+	if len(rows) <= BATCH_TABLE_MAX_ROWS:
+		await message.reply_text(format_batch_table(rows) + note, parse_mode="HTML")
+	else:
+		await message.reply_document(
+			document=InputFile(io.BytesIO(build_batch_csv(rows)), filename="lego_sets.csv"),
+			caption=format_totals(rows) + note,
+			parse_mode="HTML"
+		)
 
-	message = (
-		f"<b>Set Number:</b> {set_num}\n"
-		f"<b>Name:</b> {name}\n"
-		f"<b>Year Released:</b> {year}\n"
-		f"<b>Pieces:</b> {num_parts}"
+# ========================
+# Обработка загруженного списка (TXT / CSV)
+# ========================
+# Максимальный размер загружаемого списка
+MAX_UPLOAD_BYTES = 1_000_000
+
+async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
+	document = update.message.document
+	user = update.effective_user
+	track_feature(
+		user.id,
+		"batch_upload",
+		username=user.username,
+		language_code=user.language_code
 	)
 
-	if set_img_url:
-		try:
-			img_head = requests.head(set_img_url, allow_redirects=True, timeout=5)
-			size = int(img_head.headers.get("Content-Length", 0))
-			if size <= 5_000_000:
-				await update.message.reply_photo(photo=set_img_url)
-			else:
-				img_data = requests.get(set_img_url, timeout=10).content
-				await update.message.reply_photo(photo=InputFile(io.BytesIO(img_data), filename="lego.jpg"))
-		except Exception as e:
-			print(f"❌ Failed to send photo: {e}")
+	if document.file_size and document.file_size > MAX_UPLOAD_BYTES:
+		await update.message.reply_text("❌ File is too large. Please send a list under 1 MB.")
+		return
 
-	keyboard = build_inline_keyboard(set_id, set_url, get_lego_us_url(set_num))
-	await update.message.reply_text(text=message, parse_mode="HTML", reply_markup=keyboard)
+	file = await document.get_file()
+	data = await file.download_as_bytearray()
+	text = bytes(data).decode("utf-8-sig", errors="ignore")
+	# В CSV коды берём только из колонки с номером набора, в TXT — из всего текста
+	if (document.file_name or "").lower().endswith(".csv"):
+		codes = extract_set_codes_from_csv(text)
+	else:
+		codes = extract_set_codes(text)
+	if not codes:
+		await update.message.reply_text("❌ No LEGO set codes found in the file.")
+		return
+	await reply_batch_lookup(update.message, codes)
 
 # ========================
 # Обработка inline-кнопок
@@ -164,52 +391,50 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 	)
 
 	try:
-		action, set_id = query.data.split(":", 1)
+		action, set_id, *rest = query.data.split(":")
+		page = int(rest[0]) if rest else 0
 	except ValueError:
 		await query.message.reply_text("Error: Set information is missing.")
 		return
 
+	# Популярность учитываем только для действий, отражающих интерес к набору
+	# (открытие карточки, цены и первое открытие сводки — кнопки листания передают номер страницы),
+	# и только после того, как набор действительно нашёлся.
+
+	# Выбор набора из результатов поиска — отправляем новую карточку
+	if action == "open_set":
+		if await send_set_card(query.message, set_id):
+			record_set_query(set_id)
+		return
+
+	# Сравнение: ждём от пользователя коды наборов следующим сообщением
+	if action == "compare":
+		context.user_data["compare_base"] = set_id
+		await query.message.reply_text(f"🔀 Send one or more set codes to compare with {set_id}.")
+		return
+
 	set_num, set_name, year, num_parts = get_set_details(set_id)
-	main_message = (
-		f"<b>Set Number:</b> {set_num}\n"
-		f"<b>Name:</b> {set_name}\n"
-		f"<b>Year Released:</b> {year}\n"
-		f"<b>Pieces:</b> {num_parts}"
-	)
+	main_message = format_set_card(set_num, set_name, year, num_parts)
 
 	additional_info = ""
+	nav_row = []
 
-	if action == "parts_by_color":
-		parts = get_all_parts(set_id)
-		if not parts:
-			await query.message.edit_text(main_message + "\n⚠️ No parts data found or API error.", parse_mode="HTML")
-			return
-		color_summary = {}
-		for part in parts:
-			color = part.get("color", {})
-			color_name = color.get("name", "Unknown")
-			quantity = part.get("quantity", 0)
-			color_summary[color_name] = color_summary.get(color_name, 0) + quantity
-		lines = ["\n<b>Parts Summary by Color:</b>"]
-		for color_name, total in sorted(color_summary.items(), key=lambda x: x[1], reverse=True):
-			lines.append(f"<b>{color_name}</b>: {total}")
-		additional_info = "\n".join(lines)
-
-	elif action == "parts_by_type":
-		parts = get_all_parts(set_id)
-		if not parts:
+	if action in ("parts_by_color", "parts_by_type"):
+		rows = get_sorted_summary(action, set_id)
+		if not rows:
 			await query.message.edit_text(main_message + "\n⚠️ No parts data found or API error.", parse_mode="HTML")
 			return
-		category_summary = group_parts_by_dynamic_category(parts)
-		lines = ["\n<b>Parts Summary by Type:</b>"]
-		for cat_name, total in sorted(category_summary.items(), key=lambda x: x[1], reverse=True):
-			lines.append(f"<b>{cat_name}</b>: {total}")
-		additional_info = "\n".join(lines)
+		if not rest:
+			record_set_query(set_id)
+		title = "Parts Summary by Color" if action == "parts_by_color" else "Parts Summary by Type"
+		additional_info, nav_row = build_summary_page(title, rows, action, set_id, page)
 
 	elif action == "pricing":
-		additional_info = get_pricing_info(set_id)
+		if set_num != "n/a":
+			record_set_query(set_id)
+		additional_info = get_pricing_view(set_id)
 	else:
 		additional_info = "\n⚠️ Unknown action."
 
-	keyboard = build_inline_keyboard(set_id, f"https://rebrickable.com/sets/{set_id}/", get_lego_us_url(set_num))
+	keyboard = build_inline_keyboard(set_id, f"https://rebrickable.com/sets/{set_id}/", get_lego_us_url(set_num), nav_row)
 	await query.message.edit_text(main_message + "\n" + additional_info, parse_mode="HTML", reply_markup=keyboard)
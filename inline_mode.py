@@ -0,0 +1,168 @@
+# inline_mode.py
+
+"""
+Inline-режим бота (@bot 42176 в любом чате):
+- Ответы берутся из in-process кеша результатов, повторные запросы не ходят в API
+- Запросы приходят на каждое нажатие клавиши, поэтому ответ откладывается на
+  INLINE_DEBOUNCE_SECONDS и отбрасывается, если пользователь успел ввести что-то ещё
+- В Rebrickable идём только за полным кодом набора, которого нет в кеше, и с жёстким таймаутом
+- Текстовые запросы обслуживаются локальным поисковым индексом (без сетевых запросов)
+"""
+
+import re
+import html
+import asyncio
+from telegram import (
+	Update, InlineKeyboardMarkup, InlineKeyboardButton,
+	InlineQueryResultArticle, InputTextMessageContent
+)
+from telegram.ext import ContextTypes
+from api_rebrickable import get_set_data
+from cache import TTLCache
+from search_index import get_search_index
+from analytics import track_feature
+from handlers import format_set_card, get_lego_us_url
+
+# Пауза перед ответом, чтобы не обрабатывать промежуточные нажатия клавиш (в секундах)
+INLINE_DEBOUNCE_SECONDS = 0.4
+
+# Жёсткий таймаут запроса к Rebrickable — Telegram ждёт ответ на inline-запрос ~10 секунд
+INLINE_FETCH_TIMEOUT_SECONDS = 4
+
+# Сколько секунд Telegram может хранить ответ на своей стороне.
+# Результаты не зависят от пользователя (is_personal=False), поэтому кеш общий для всех.
+INLINE_CACHE_TIME_CODE = 86400
+INLINE_CACHE_TIME_SEARCH = 3600
+INLINE_CACHE_TIME_EMPTY = 10
+
+# Максимум результатов поиска в одном ответе
+INLINE_MAX_RESULTS = 10
+
+# Кеш готовых ответов: { нормализованный запрос: ([InlineQueryResultArticle, ...], cache_time) }
+inline_results_cache = TTLCache(max_items=2048, ttl_seconds=INLINE_CACHE_TIME_CODE)
+
+# Последний inline-запрос каждого пользователя: { user_id: query_id } — для debounce
+_latest_query = {}
+
+def build_set_result(data: dict) -> InlineQueryResultArticle:
+	"""
+	Создаёт inline-результат с карточкой набора из JSON Rebrickable.
+	Кнопки только со ссылками: callback-кнопки в чужом чате не могут отредактировать сообщение.
+	"""
+	set_num = data.get("set_num", "n/a")
+	name = data.get("name", "n/a")
+	year = data.get("year", "n/a")
+	num_parts = data.get("num_parts", "n/a")
+	set_url = data.get("set_url") or f"https://rebrickable.com/sets/{set_num}/"
+	set_img_url = data.get("set_img_url")
+
+	text = format_set_card(set_num, html.escape(name), year, num_parts)
+	if set_img_url:
+		# Невидимая ссылка на картинку — Telegram покажет превью набора
+		text = f'<a href="{html.escape(set_img_url)}">&#8203;</a>' + text
+
+	return InlineQueryResultArticle(
+		id=set_num,
+		title=f"{set_num} · {name}",
+		description=f"{year} · {num_parts} pieces",
+		thumbnail_url=set_img_url,
+		input_message_content=InputTextMessageContent(text, parse_mode="HTML"),
+		reply_markup=InlineKeyboardMarkup([
+			[InlineKeyboardButton("View on Rebrickable", url=set_url)],
+			[InlineKeyboardButton("View on LEGO US", url=get_lego_us_url(set_num))]
+		])
+	)
+
+def build_search_result(set_num, name, year, theme) -> InlineQueryResultArticle:
+	"""
+	Создаёт inline-результат по найденному в индексе набору (без запроса к API).
+	"""
+	text = (
+		f"<b>Set Number:</b> {set_num}\n"
+		f"<b>Name:</b> {html.escape(name)}\n"
+		f"<b>Year Released:</b> {year}"
+	)
+	return InlineQueryResultArticle(
+		id=set_num,
+		title=f"{set_num} · {name}",
+		description=f"{year} · {theme}",
+		input_message_content=InputTextMessageContent(text, parse_mode="HTML"),
+		reply_markup=InlineKeyboardMarkup([
+			[InlineKeyboardButton("View on Rebrickable", url=f"https://rebrickable.com/sets/{set_num}/")],
+			[InlineKeyboardButton("View on LEGO US", url=get_lego_us_url(set_num))]
+		])
+	)
+
+async def fetch_set_results(set_id: str):
+	"""
+	Загружает набор из Rebrickable с жёстким таймаутом.
+	Возвращает список результатов (пустой, если набор не найден) или None при таймауте/ошибке.
+	Таймаут передаётся и в сам HTTP-запрос, чтобы зависший вызов не занимал поток пула.
+	"""
+	try:
+		status_code, data = await asyncio.wait_for(
+			asyncio.to_thread(get_set_data, set_id, INLINE_FETCH_TIMEOUT_SECONDS),
+			timeout=INLINE_FETCH_TIMEOUT_SECONDS + 1
+		)
+	except Exception as e:
+		print(f"⚠️ Inline fetch for {set_id} failed: {e}")
+		return None
+	if status_code == 404:
+		return []
+	if status_code != 200:
+		return None
+	return [build_set_result(data)]
+
+# ========================
+# Обработка inline-запросов
+# ========================
+async def handle_inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
+	inline_query = update.inline_query
+	text = inline_query.query.strip().lower()
+	user = inline_query.from_user
+
+	if not text:
+		await inline_query.answer([], cache_time=INLINE_CACHE_TIME_EMPTY, is_personal=False)
+		return
+
+	# Уже есть готовый ответ — отдаём сразу, без debounce и сетевых запросов
+	cached = inline_results_cache.get(text)
+	if cached is not None:
+		results, cache_time = cached
+		await inline_query.answer(results, cache_time=cache_time, is_personal=False)
+		return
+
+	# Debounce: ждём паузу в наборе и отвечаем только на последний запрос пользователя.
+	# Работает только потому, что хендлер зарегистрирован с block=False (см. main.py):
+	# следующее нажатие обрабатывается параллельно и перезаписывает _latest_query.
+	_latest_query[user.id] = inline_query.id
+	await asyncio.sleep(INLINE_DEBOUNCE_SECONDS)
+	if _latest_query.get(user.id) != inline_query.id:
+		return
+	_latest_query.pop(user.id, None)
+
+	track_feature(
+		user.id,
+		"inline_query",
+		username=user.username,
+		language_code=user.language_code
+	)
+
+	match = re.fullmatch(r"(\d{4,5})(-\d+)?", text)
+	if match:
+		set_id = f"{match.group(1)}{match.group(2) or '-1'}"
+		results = await fetch_set_results(set_id)
+		if results is None:
+			# Таймаут или ошибка API — не кешируем, пусть Telegram спросит снова
+			await inline_query.answer([], cache_time=0, is_personal=False)
+			return
+		cache_time = INLINE_CACHE_TIME_CODE if results else INLINE_CACHE_TIME_EMPTY
+	else:
+		index = get_search_index()
+		found = index.search(text, limit=INLINE_MAX_RESULTS) if index else []
+		results = [build_search_result(*item) for item in found]
+		cache_time = INLINE_CACHE_TIME_SEARCH if results else INLINE_CACHE_TIME_EMPTY
+
+	if results:
+		inline_results_cache.set(text, (results, cache_time))
+	await inline_query.answer(results, cache_time=cache_time, is_personal=False)
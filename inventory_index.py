@@ -0,0 +1,170 @@
+# inventory_index.py
+
+"""
+Индексированный инвентарь наборов для сравнения:
+- Инвентарь набора сворачивается в хеш-индекс { (part_num, color_id): quantity }
+- Индексы кешируются (TTLCache), повторные сравнения не скачивают детали заново
+- Общие детали, уникальные детали каждого набора и недостающие детали для сборки (MOC)
+  считаются операциями над множествами ключей, без вложенных проходов по спискам
+"""
+
+import html
+from cache import TTLCache
+from api_rebrickable import get_all_parts, REBRICKABLE_CACHE_TTL_HOURS
+
+# Сколько строк деталей показываем в каждом разделе отчёта
+COMPARE_MAX_LINES = 10
+
+# Названия деталей длиннее этого обрезаются в подписях (названия деталей Technic бывают очень длинными)
+COMPARE_MAX_NAME_CHARS = 50
+
+# Лимит длины одного сообщения отчёта — с запасом до лимита Telegram в 4096 символов
+COMPARE_MESSAGE_MAX_CHARS = 3500
+
+class SetInventory:
+	"""
+	Инвентарь одного набора (без запасных деталей).
+	quantities — хеш-индекс { (part_num, color_id): quantity },
+	labels — подписи для отчёта { (part_num, color_id): "part name (color name)" }.
+	"""
+
+	def __init__(self, set_id, parts):
+		self.set_id = set_id
+		self.quantities = {}
+		self.labels = {}
+		for part in parts:
+			if part.get("is_spare"):
+				continue
+			part_obj = part.get("part", {})
+			color = part.get("color", {})
+			key = (part_obj.get("part_num"), color.get("id"))
+			self.quantities[key] = self.quantities.get(key, 0) + part.get("quantity", 0)
+			if key not in self.labels:
+				name = part_obj.get("name") or key[0]
+				if len(name) > COMPARE_MAX_NAME_CHARS:
+					name = name[:COMPARE_MAX_NAME_CHARS - 1] + "…"
+				self.labels[key] = f"{name} ({color.get('name', 'Unknown')})"
+
+	def __len__(self):
+		return len(self.quantities)
+
+	def total(self, keys=None) -> int:
+		"""
+		Количество деталей по всем ключам или по переданному подмножеству.
+		"""
+		if keys is None:
+			return sum(self.quantities.values())
+		return sum(self.quantities[key] for key in keys)
+
+# Кеш проиндексированных наборов: { set_id: SetInventory }
+inventory_cache = TTLCache(max_items=64, ttl_seconds=REBRICKABLE_CACHE_TTL_HOURS * 3600)
+
+def get_set_inventory(set_id):
+	"""
+	Возвращает SetInventory из кеша или строит его из get_all_parts.
+	Возвращает None, если детали набора получить не удалось (результат не кешируется).
+	"""
+	inventory = inventory_cache.get(set_id)
+	if inventory is not None:
+		return inventory
+
+	parts = get_all_parts(set_id)
+	if not parts:
+		return None
+	inventory = SetInventory(set_id, parts)
+	inventory_cache.set(set_id, inventory)
+	return inventory
+
+# ============================
+# 🔀 Сравнение наборов
+# ============================
+def shared_parts(inventories):
+	"""
+	Детали, которые есть во всех наборах: { key: минимальное количество среди наборов }.
+	"""
+	keys = set(inventories[0].quantities).intersection(*(inv.quantities for inv in inventories[1:]))
+	return {key: min(inv.quantities[key] for inv in inventories) for key in keys}
+
+def unique_parts(inventory, others):
+	"""
+	Ключи деталей, которые есть только в inventory и нет ни в одном из others.
+	"""
+	return set(inventory.quantities).difference(*(inv.quantities for inv in others))
+
+def missing_parts(target, owned):
+	"""
+	Что ещё нужно для сборки target, если в наличии все детали наборов owned:
+	{ key: недостающее количество }.
+	"""
+	available = {}
+	for inv in owned:
+		for key, quantity in inv.quantities.items():
+			available[key] = available.get(key, 0) + quantity
+	needed = {}
+	for key, quantity in target.quantities.items():
+		shortfall = quantity - available.get(key, 0)
+		if shortfall > 0:
+			needed[key] = shortfall
+	return needed
+
+def format_part_lines(counts, labels):
+	"""
+	Строки отчёта для самых многочисленных деталей (не больше COMPARE_MAX_LINES).
+	"""
+	top = sorted(counts.items(), key=lambda x: x[1], reverse=True)[:COMPARE_MAX_LINES]
+	lines = [f"• {html.escape(labels.get(key, key[0]))} × {quantity}" for key, quantity in top]
+	if len(counts) > COMPARE_MAX_LINES:
+		lines.append(f"<i>…and {len(counts) - COMPARE_MAX_LINES} more</i>")
+	return lines
+
+def pack_sections(sections):
+	"""
+	Склеивает разделы отчёта в сообщения не длиннее COMPARE_MESSAGE_MAX_CHARS.
+	Раздел целиком попадает в одно сообщение (с обрезанными названиями деталей он всегда короче лимита).
+	"""
+	messages = []
+	for section in sections:
+		if messages and len(messages[-1]) + len(section) + 2 <= COMPARE_MESSAGE_MAX_CHARS:
+			messages[-1] += "\n\n" + section
+		else:
+			messages.append(section)
+	return messages
+
+def format_comparison(inventories):
+	"""
+	Формирует HTML-отчёт сравнения: общие детали, уникальные для каждого набора
+	и что нужно докупить для сборки первого набора из остальных.
+	Возвращает список сообщений — при большом числе наборов отчёт не влезает в одно.
+	"""
+	labels = {}
+	for inv in inventories:
+		labels.update(inv.labels)
+
+	names = " vs ".join(inv.set_id for inv in inventories)
+	shared = shared_parts(inventories)
+	sections = ["\n".join(
+		[
+			f"<b>🔀 Part overlap: {names}</b>",
+			"",
+			f"<b>Shared by all:</b> {len(shared)} part types · {sum(shared.values())} pieces",
+		] + format_part_lines(shared, labels)
+	)]
+
+	for inv in inventories:
+		others = [other for other in inventories if other is not inv]
+		unique = unique_parts(inv, others)
+		sections.append("\n".join(
+			[f"<b>Only in {inv.set_id}:</b> {len(unique)} part types · {inv.total(unique)} pieces"]
+			+ format_part_lines({key: inv.quantities[key] for key in unique}, labels)
+		))
+
+	target, owned = inventories[0], inventories[1:]
+	needed = missing_parts(target, owned)
+	owned_names = ", ".join(inv.set_id for inv in owned)
+	sections.append("\n".join(
+		[
+			f"<b>🧱 To build {target.set_id} from {owned_names}:</b> "
+			f"{len(needed)} part types · {sum(needed.values())} pieces still needed"
+		] + format_part_lines(needed, labels)
+	))
+	return pack_sections(sections)
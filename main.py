@@ -7,27 +7,43 @@ from telegram.ext import (
 	CommandHandler,
 	MessageHandler,
 	CallbackQueryHandler,
+	InlineQueryHandler,
 	filters,
 )
 from db import init_db            # ✅ инициализация базы данных
 from newsletter import newsletter_loop  # ✅ запуск фоновой задачи по отправке рассылок
+from catalog_mirror import catalog_mirror_loop  # ✅ перезагрузка локального зеркала каталога Rebrickable
+from api_rebrickable import use_mirror
+from search_index import search_index_loop  # ✅ фоновая перестройка поискового индекса наборов
+from cache_warmer import cache_warm_loop  # ✅ прогрев кешей для популярных наборов
+from price_history import price_history_loop  # ✅ ночное обновление истории цен
 from handlers import (
 	start,
 	newsletters,
+	compare,
 	handle_text,
+	handle_document,
 	handle_callback
 )  # ✅ импорт всех хендлеров из handlers.py
+from inline_mode import handle_inline_query  # ✅ inline-режим (@bot 42176 в любом чате)
 
 # ---------------------------
 # 🚀 Функция запуска фоновой рассылки после старта приложения
 # ---------------------------
 async def post_init(application):
 	"""
-	Запускает фоновую задачу рассылки новостей после инициализации Telegram-приложения.
+	Запускает фоновые задачи после инициализации Telegram-приложения:
+	рассылку новостей, перестройку поискового индекса, прогрев кешей популярных наборов,
+	ночное обновление истории цен и перезагрузку зеркала каталога (если включён режим mirror).
 	Используется безопасный способ запуска задачи, привязанный к event loop.
 	"""
 	loop = asyncio.get_running_loop()
 	loop.create_task(newsletter_loop(application.bot))
+	loop.create_task(search_index_loop())
+	loop.create_task(cache_warm_loop())
+	loop.create_task(price_history_loop())
+	if use_mirror():
+		loop.create_task(catalog_mirror_loop())
 
 
 # ========================
@@ -43,8 +59,13 @@ if __name__ == "__main__":
 	# 📌 Регистрируем команды и обработчики
 	app.add_handler(CommandHandler("start", start))
 	app.add_handler(CommandHandler("newsletters", newsletters))
+	app.add_handler(CommandHandler("compare", compare))
 	app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text))
+	app.add_handler(MessageHandler(filters.Document.TXT | filters.Document.FileExtension("csv"), handle_document))
 	app.add_handler(CallbackQueryHandler(handle_callback))
+	# block=False: inline-запросы обрабатываются параллельно, иначе debounce не видит
+	# следующее нажатие клавиши и задерживает очередь обновлений для всех пользователей
+	app.add_handler(InlineQueryHandler(handle_inline_query, block=False))
 
     # ✅ импорт всех хендлеров из handlers.py
 	app.run_polling()
@@ -0,0 +1,71 @@
+# popularity.py
+
+"""
+Учёт популярности наборов с экспоненциальным затуханием:
+- Каждый запрос набора добавляет к его score вес 2^((t - эпоха) / период полураспада)
+- Так score хранится «приведённым к эпохе»: сравнивать наборы можно без пересчёта,
+  а текущее затухшее значение равно score * 2^(-(now - эпоха) / период полураспада)
+- Чтобы вес не переполнял float с годами, хранится натуральный логарифм score (log_score),
+  а сложение выполняется как logaddexp
+- Запросы копятся в памяти и сбрасываются в Postgres пачкой (без записи в БД на каждый клик)
+"""
+
+import os
+import math
+import threading
+from datetime import datetime
+from db import add_set_popularity
+
+# Период полураспада популярности (в часах)
+POPULARITY_HALF_LIFE_HOURS = float(os.getenv("POPULARITY_HALF_LIFE_HOURS", "72"))
+
+# Эпоха, от которой отсчитывается вес запросов
+POPULARITY_EPOCH = datetime(2025, 1, 1)
+
+# Накопленные, ещё не сохранённые прибавки: { set_id: log_score }
+_pending = {}
+_lock = threading.Lock()
+
+def query_log_weight(at: datetime) -> float:
+	"""
+	Логарифм веса одного запроса в момент at (вес растёт вдвое каждые POPULARITY_HALF_LIFE_HOURS).
+	"""
+	hours = (at - POPULARITY_EPOCH).total_seconds() / 3600
+	return hours / POPULARITY_HALF_LIFE_HOURS * math.log(2)
+
+def log_add(a: float, b: float) -> float:
+	"""
+	ln(e^a + e^b) без переполнения.
+	"""
+	return max(a, b) + math.log1p(math.exp(-abs(a - b)))
+
+def merge_pending(set_id: str, log_score: float):
+	"""
+	Добавляет log_score к буферу несохранённых прибавок (вызывается под _lock).
+	"""
+	current = _pending.get(set_id)
+	_pending[set_id] = log_score if current is None else log_add(current, log_score)
+
+def record_set_query(set_id: str):
+	"""
+	Учитывает запрос набора (только в памяти, в БД попадёт при flush_popularity).
+	"""
+	log_weight = query_log_weight(datetime.utcnow())
+	with _lock:
+		merge_pending(set_id, log_weight)
+
+def flush_popularity():
+	"""
+	Сохраняет накопленные прибавки в таблицу set_popularity одной пачкой.
+	При ошибке прибавки возвращаются в буфер и будут сохранены при следующем вызове.
+	"""
+	global _pending
+	with _lock:
+		increments, _pending = _pending, {}
+	try:
+		add_set_popularity(increments, datetime.utcnow())
+	except Exception:
+		with _lock:
+			for set_id, log_score in increments.items():
+				merge_pending(set_id, log_score)
+		raise
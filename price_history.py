@@ -0,0 +1,130 @@
+# price_history.py
+
+"""
+История цен наборов (BrickEconomy):
+- Ночное пакетное обновление снимков цен для отслеживаемых наборов в пределах дневной квоты
+- Экран цен и стоимость в пакетных итогах берутся из последнего сохранённого снимка,
+  без запроса к BrickEconomy
+- Строка "изменение за месяц" — сравнение с последним снимком месячной давности
+"""
+
+import os
+import asyncio
+from datetime import datetime, timedelta
+from api_brickeconomy import fetch_pricing_data, format_pricing_info
+from db import add_price_snapshots, get_latest_price_snapshot, get_sets_for_price_refresh
+
+# Час (UTC), в который запускается обновление — вне пиковой нагрузки
+PRICE_REFRESH_HOUR_UTC = int(os.getenv("PRICE_REFRESH_HOUR_UTC", "3"))
+
+# Максимум запросов к BrickEconomy за одно ночное обновление
+PRICE_REFRESH_QUOTA = int(os.getenv("PRICE_REFRESH_QUOTA", "100"))
+
+# Пауза между запросами, чтобы не упираться в rate limit BrickEconomy (в секундах)
+PRICE_REFRESH_DELAY_SECONDS = 1
+
+# Сколько снимков сохраняем в БД за один INSERT
+PRICE_SNAPSHOT_BATCH_SIZE = 25
+
+# Снимок моложе этого возраста считается свежим и не обновляется
+PRICE_SNAPSHOT_MAX_AGE = timedelta(hours=20)
+
+# ============================
+# 🌙 Ночное обновление
+# ============================
+async def refresh_price_snapshots(quota: int = PRICE_REFRESH_QUOTA):
+	"""
+	Обновляет снимки цен для самых популярных наборов без свежего снимка, не более quota запросов.
+	Снимки сохраняются пачками по PRICE_SNAPSHOT_BATCH_SIZE.
+	Возвращает количество сохранённых снимков.
+	"""
+	set_nums = await asyncio.to_thread(get_sets_for_price_refresh, datetime.utcnow() - PRICE_SNAPSHOT_MAX_AGE, quota)
+	saved = 0
+	batch = []
+	for set_num in set_nums:
+		try:
+			data, error = await asyncio.to_thread(fetch_pricing_data, set_num)
+		except Exception as e:
+			data, error = None, str(e)
+		if data:
+			batch.append((set_num, datetime.utcnow(), data))
+		elif error:
+			print(f"⚠️ Price refresh failed for {set_num}")
+
+		if len(batch) >= PRICE_SNAPSHOT_BATCH_SIZE:
+			await asyncio.to_thread(add_price_snapshots, batch)
+			saved += len(batch)
+			batch = []
+		await asyncio.sleep(PRICE_REFRESH_DELAY_SECONDS)
+
+	await asyncio.to_thread(add_price_snapshots, batch)
+	return saved + len(batch)
+
+def seconds_until_refresh(now: datetime) -> float:
+	"""
+	Сколько секунд осталось до ближайшего PRICE_REFRESH_HOUR_UTC:00.
+	"""
+	next_run = now.replace(hour=PRICE_REFRESH_HOUR_UTC, minute=0, second=0, microsecond=0)
+	if next_run <= now:
+		next_run += timedelta(days=1)
+	return (next_run - now).total_seconds()
+
+async def price_history_loop():
+	"""
+	Фоновая задача: раз в сутки в PRICE_REFRESH_HOUR_UTC обновляет снимки цен.
+	"""
+	print(f"📈 Price history job started, daily at {PRICE_REFRESH_HOUR_UTC:02d}:00 UTC, quota {PRICE_REFRESH_QUOTA}...")
+	while True:
+		await asyncio.sleep(seconds_until_refresh(datetime.utcnow()))
+		try:
+			saved = await refresh_price_snapshots()
+			print(f"📈 Saved {saved} price snapshots.")
+		except Exception as e:
+			print(f"⚠️ Price history refresh failed: {e}")
+
+# ============================
+# 💵 Экран цен из истории
+# ============================
+def get_current_value(set_num: str):
+	"""
+	Возвращает текущую стоимость нового набора (value_new, USD) из последнего снимка
+	или None, если снимка нет. Запросов к BrickEconomy не делает — используется в пакетных итогах.
+	"""
+	latest = get_latest_price_snapshot(set_num)
+	return latest.get("value_new") if latest else None
+
+def format_monthly_change(latest: dict, month_ago: dict) -> str:
+	"""
+	Строка с изменением текущей стоимости (new) относительно снимка месячной давности.
+	Возвращает пустую строку, если сравнивать не с чем.
+	"""
+	if not month_ago:
+		return ""
+	old, new = month_ago.get("value_new"), latest.get("value_new")
+	if not old or not new:
+		return ""
+	change = (new - old) / old * 100
+	icon = "📈" if change > 0 else "📉" if change < 0 else "➖"
+	return f"\n{icon} <b>Since last month:</b> ${old:.2f} → ${new:.2f} ({change:+.1f}%)"
+
+def get_pricing_view(set_num: str) -> str:
+	"""
+	Возвращает HTML-экран цен набора из последнего сохранённого снимка.
+	Если снимков ещё нет (набор раньше не запрашивали) — один раз запрашивает BrickEconomy
+	и сохраняет снимок; дальше набор обновляется ночным заданием.
+	"""
+	try:
+		latest = get_latest_price_snapshot(set_num)
+		if latest is None:
+			data, error = fetch_pricing_data(set_num)
+			if error:
+				return error
+			add_price_snapshots([(set_num, datetime.utcnow(), data)])
+			return format_pricing_info(data)
+
+		month_ago = get_latest_price_snapshot(set_num, before=latest["taken_at"] - timedelta(days=30))
+		text = format_pricing_info(latest["data"])
+		updated = latest["taken_at"].strftime("%d %b %Y")
+		return text + format_monthly_change(latest, month_ago) + f"\n<i>Updated {updated}</i>"
+	except Exception as e:
+		return f"⚠️ Pricing data unavailable:\n{str(e)}"
@@ -0,0 +1,187 @@
+# search_index.py
+
+"""
+In-process поисковый индекс по наборам LEGO:
+- Поиск по номеру, названию и теме набора ("Millennium Falcon", "technic 4x4")
+- Токены + префиксный поиск по отсортированному словарю (bisect), без сетевых запросов
+- Компактное хранение: параллельные списки и array-постинги вместо словаря на каждый набор
+- Перестройка в фоне по расписанию из Rebrickable API или локального sets.csv
+"""
+
+import os
+import re
+import csv
+import io
+import asyncio
+import unicodedata
+from array import array
+from bisect import bisect_left
+from api_rebrickable import get_all_sets, get_themes
+from catalog_mirror import CATALOG_CSV_DIR, find_local_csv, open_local_csv
+
+# Интервал перестройки индекса (в часах)
+SEARCH_INDEX_REFRESH_HOURS = float(os.getenv("SEARCH_INDEX_REFRESH_HOURS", "24"))
+
+# Сколько словарных токенов максимум раскрываем для одного короткого префикса
+MAX_PREFIX_EXPANSION = 200
+
+# Веса при ранжировании
+EXACT_TOKEN_SCORE = 3
+PREFIX_TOKEN_SCORE = 1
+
+def tokenize(text: str):
+	"""
+	Разбивает строку на токены: нижний регистр, без диакритики, только буквы и цифры.
+	"""
+	text = unicodedata.normalize("NFKD", text or "")
+	text = text.encode("ascii", "ignore").decode("ascii").lower()
+	return re.findall(r"[a-z0-9]+", text)
+
+class SetSearchIndex:
+	"""
+	Инвертированный индекс: токен → array('I') с номерами наборов.
+	Данные наборов лежат в параллельных списках (set_nums, names, years, theme_ids),
+	темы — в отдельном словаре, общем для всех наборов.
+	"""
+
+	def __init__(self, sets, themes):
+		"""
+		sets — итерируемое словарей с ключами set_num, name, year, theme_id, num_parts
+		themes — словарь { theme_id: theme_name }
+		"""
+		self.set_nums = []
+		self.names = []
+		self.years = array("H")
+		self.theme_ids = array("I")
+		self.themes = themes
+		postings = {}
+
+		for item in sets:
+			set_num = item.get("set_num")
+			if not set_num:
+				continue
+			doc_id = len(self.set_nums)
+			theme_id = int(item.get("theme_id") or 0)
+			self.set_nums.append(set_num)
+			self.names.append(item.get("name") or "")
+			self.years.append(int(item.get("year") or 0))
+			self.theme_ids.append(theme_id)
+
+			tokens = set(tokenize(item.get("name")))
+			tokens.update(tokenize(themes.get(theme_id, "")))
+			tokens.update(tokenize(set_num))
+			for token in tokens:
+				postings.setdefault(token, array("I")).append(doc_id)
+
+		self.tokens = sorted(postings)
+		self.postings = postings
+
+	def __len__(self):
+		return len(self.set_nums)
+
+	def expand(self, token: str):
+		"""
+		Возвращает список (словарный токен, вес) для токена запроса:
+		точное совпадение и токены, начинающиеся с него.
+		"""
+		matches = []
+		start = bisect_left(self.tokens, token)
+		for candidate in self.tokens[start:start + MAX_PREFIX_EXPANSION]:
+			if not candidate.startswith(token):
+				break
+			matches.append((candidate, EXACT_TOKEN_SCORE if candidate == token else PREFIX_TOKEN_SCORE))
+		return matches
+
+	def search(self, query: str, limit: int = 8):
+		"""
+		Ищет наборы по запросу. Сначала требуются совпадения по всем токенам запроса,
+		если таких нет — возвращаются лучшие частичные совпадения.
+		Ранжирование: сумма весов токенов, затем более новые наборы.
+		Возвращает список (set_num, name, year, theme_name).
+		"""
+		query_tokens = list(dict.fromkeys(tokenize(query)))
+		if not query_tokens:
+			return []
+
+		scores = {}
+		hits = {}
+		for token in query_tokens:
+			best = {}
+			for candidate, weight in self.expand(token):
+				for doc_id in self.postings[candidate]:
+					if weight > best.get(doc_id, 0):
+						best[doc_id] = weight
+			for doc_id, weight in best.items():
+				scores[doc_id] = scores.get(doc_id, 0) + weight
+				hits[doc_id] = hits.get(doc_id, 0) + 1
+
+		full = [doc_id for doc_id, count in hits.items() if count == len(query_tokens)]
+		candidates = full or list(scores)
+		candidates.sort(key=lambda doc_id: (scores[doc_id], self.years[doc_id]), reverse=True)
+
+		return [
+			(
+				self.set_nums[doc_id],
+				self.names[doc_id],
+				self.years[doc_id],
+				self.themes.get(self.theme_ids[doc_id], ""),
+			)
+			for doc_id in candidates[:limit]
+		]
+
+# Текущий индекс; заменяется целиком при перестройке (атомарная замена ссылки)
+_index = None
+
+def get_search_index():
+	"""
+	Возвращает текущий индекс или None, если он ещё не построен.
+	"""
+	return _index
+
+def load_sets_from_directory(directory):
+	"""
+	Читает наборы и темы из локальных sets.csv / themes.csv (или .csv.gz).
+	Возвращает кортеж (sets, themes) или None, если sets.csv не найден.
+	"""
+	sets_path = find_local_csv(directory, "sets")
+	if not sets_path:
+		return None
+	themes = {}
+	themes_path = find_local_csv(directory, "themes")
+	if themes_path:
+		with open_local_csv(themes_path) as stream:
+			for row in csv.DictReader(io.TextIOWrapper(stream, encoding="utf-8-sig")):
+				themes[int(row["id"])] = row["name"]
+	with open_local_csv(sets_path) as stream:
+		sets = list(csv.DictReader(io.TextIOWrapper(stream, encoding="utf-8-sig")))
+	return sets, themes
+
+def build_search_index():
+	"""
+	Строит новый индекс из локальной папки CATALOG_CSV_DIR (если в ней есть sets.csv)
+	или постраничной выгрузкой /lego/sets/ из Rebrickable API, и делает его текущим.
+	Если выгрузка неполная (get_all_pages выбросил исключение), текущий индекс не меняется.
+	"""
+	global _index
+	source = load_sets_from_directory(CATALOG_CSV_DIR) if CATALOG_CSV_DIR else None
+	if source is None:
+		source = (get_all_sets(), get_themes())
+	sets, themes = source
+	if not sets:
+		raise RuntimeError("no sets received")
+	_index = SetSearchIndex(sets, themes)
+	return _index
+
+async def search_index_loop():
+	"""
+	Фоновая задача: строит индекс при старте и перестраивает его раз в SEARCH_INDEX_REFRESH_HOURS.
+	Построение идёт в отдельном потоке; до его окончания поиск работает по старому индексу.
+	"""
+	print(f"🔎 Search index job started with interval {SEARCH_INDEX_REFRESH_HOURS} hours...")
+	while True:
+		try:
+			index = await asyncio.to_thread(build_search_index)
+			print(f"🔎 Search index built: {len(index)} sets, {len(index.tokens)} tokens.")
+		except Exception as e:
+			print(f"⚠️ Search index build failed: {e}")
+		await asyncio.sleep(SEARCH_INDEX_REFRESH_HOURS * 3600)
@@ -0,0 +1,109 @@
+# test_catalog_mirror.py
+
+"""
+Проверка импорта зеркала каталога на маленьких CSV из tests/fixtures/catalog:
+- выбор нужных колонок по заголовку и приведение типов (NULLIF(...)::type)
+- выбор последней версии инвентаря и порядок деталей в mirror_get_all_parts
+- загрузка .csv.gz и повторная загрузка (подмена таблиц)
+
+Нужен отдельный PostgreSQL: TEST_DATABASE_URL=postgresql://... python -m unittest discover tests
+Без TEST_DATABASE_URL тесты пропускаются.
+"""
+
+import os
+import sys
+import gzip
+import shutil
+import tempfile
+import unittest
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures", "catalog")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@unittest.skipUnless(TEST_DATABASE_URL, "TEST_DATABASE_URL is not set")
+class CatalogMirrorTest(unittest.TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+		# db.py читает DATABASE_URL при импорте — подставляем тестовую базу до импорта модулей
+		os.environ["DATABASE_URL"] = TEST_DATABASE_URL
+		global psycopg2, db, catalog_mirror
+		import psycopg2
+		import db
+		import catalog_mirror
+		db.init_db()
+		cls.imported = catalog_mirror.import_from_directory(FIXTURES_DIR)
+
+	def test_import_counts(self):
+		self.assertEqual(self.imported, {
+			"colors": 3,
+			"part_categories": 3,
+			"parts": 3,
+			"themes": 2,
+			"sets": 2,
+			"inventories": 3,
+			"inventory_parts": 5,
+		})
+
+	def test_set_details(self):
+		self.assertEqual(
+			catalog_mirror.mirror_get_set_details("75192-1"),
+			("75192-1", "Millennium Falcon, UCS", 2017, 7541)
+		)
+		self.assertIsNone(catalog_mirror.mirror_get_set_details("0000-1"))
+
+	def test_all_parts_uses_latest_inventory_version(self):
+		parts = catalog_mirror.mirror_get_all_parts("42176-1")
+		self.assertEqual(
+			[(p["part"]["part_num"], p["color"]["id"], p["quantity"], p["is_spare"]) for p in parts],
+			[("3001", 0, 4, False), ("3020", 4, 2, False), ("3062b", 47, 1, True)]
+		)
+		first = parts[0]
+		self.assertEqual(first["part"], {"part_num": "3001", "name": "Brick 2 x 4", "part_cat_id": 11})
+		self.assertEqual(first["color"]["name"], "Black")
+
+	def test_all_parts_missing_set(self):
+		self.assertEqual(catalog_mirror.mirror_get_all_parts("0000-1"), [])
+
+	def test_categories(self):
+		self.assertEqual(catalog_mirror.mirror_get_categories(), {
+			11: "Bricks",
+			14: "Plates",
+			20: "Bricks Round and Cones",
+		})
+
+	def test_casts_booleans_and_empty_values(self):
+		with psycopg2.connect(TEST_DATABASE_URL) as conn:
+			with conn.cursor() as cur:
+				cur.execute("SELECT id, is_trans FROM rb_colors ORDER BY id")
+				self.assertEqual(cur.fetchall(), [(0, False), (4, False), (47, True)])
+				cur.execute("SELECT id, parent_id FROM rb_themes ORDER BY id")
+				self.assertEqual(cur.fetchall(), [(1, None), (158, None)])
+
+	def test_reload_from_gzip(self):
+		tmp = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, tmp)
+		with open(os.path.join(FIXTURES_DIR, "sets.csv"), "rb") as src:
+			with gzip.open(os.path.join(tmp, "sets.csv.gz"), "wb") as dst:
+				shutil.copyfileobj(src, dst)
+
+		self.assertEqual(catalog_mirror.import_from_directory(tmp), {"sets": 2})
+		self.assertEqual(
+			catalog_mirror.mirror_get_set_details("42176-1"),
+			("42176-1", "Porsche GT4 e-Performance Race Car", 2024, 834)
+		)
+
+	def test_missing_column_keeps_old_table(self):
+		tmp = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, tmp)
+		with open(os.path.join(tmp, "sets.csv"), "w") as f:
+			f.write("set_num,name\n1234-1,Broken\n")
+
+		with self.assertRaises(ValueError):
+			catalog_mirror.import_from_directory(tmp)
+		self.assertIsNotNone(catalog_mirror.mirror_get_set_details("75192-1"))
+
+if __name__ == "__main__":
+	unittest.main()